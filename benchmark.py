@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'simulator'))
+
+from config import Config
+from distribution import Distribution
+from log import Log, ParquetLog, RecordLog
+from local_backend import Allocation, DeploymentRequest
+from sim import simulate
+
+DISTRIBUTIONS = {
+    'const': {'distribution': 'const', 'mean': 1024},
+    'unif': {'distribution': 'unif', 'min': 256, 'max': 2048, 'int': 1},
+    'exp': {'distribution': 'exp', 'mean': 10},
+    'pareto': {'distribution': 'pareto', 'shape': 2.5, 'mode': 1, 'int': 1},
+}
+
+SIMULATION = {
+    'seed': 0,
+    'resource': 'memory',
+    'resource_scale': 1e6,
+    'size': {'distribution': 'unif', 'min': 256, 'max': 2048, 'int': 1},
+    'offer': {'distribution': 'exp', 'mean': 10},
+    'halting_threshold': 0.05,
+    'application': 'benchmark',
+    'backend': 'local',
+    'nodes': 1000,
+    'node_capacity': 16e9,
+}
+
+
+# runs fn repeat times and returns the best throughput in operations/second
+def throughput(fn, operations, repeat):
+    best = float('inf')
+    for i in range(repeat):
+        start = time.time()
+        fn()
+        best = min(best, time.time() - start)
+    return operations / max(best, 1e-9)
+
+
+def bench_distribution(results, n, repeat):
+    for name, params in sorted(DISTRIBUTIONS.items()):
+        d = Distribution(params, 0)
+
+        def get_value():
+            for i in range(n):
+                d.get_value()
+        results['distribution.%s.get_value' % name] = \
+            throughput(get_value, n, repeat)
+        results['distribution.%s.get_values' % name] = \
+            throughput(lambda: d.get_values(n), n, repeat)
+
+        # distinct intervals always miss the probability cache
+        def get_probability():
+            for i in range(n):
+                d.d.get_probability(0, i)
+        results['distribution.%s.cdf' % name] = \
+            throughput(get_probability, n, repeat)
+
+        def get_cached_probability():
+            for i in range(n):
+                d.get_probability(0, i % 64)
+        results['distribution.%s.cached_cdf' % name] = \
+            throughput(get_cached_probability, n, repeat)
+
+
+def bench_config(results, tmp, n, repeat):
+    # a large generated config with one comment per parameter and a sweep of
+    # about 10^9 runs
+    section = {'output': 'out_{seed}_{a}_{b}_{c}.csv'}
+    for p, size in [('seed', 1000), ('a', 1000), ('b', 100), ('c', 10)]:
+        section[p] = list(range(size))
+    lines = ['{"simulation" : {']
+    for i in range(20000):
+        lines.append('    // parameter %d' % i)
+        lines.append('    "p%d" : %d,' % (i, i))
+    for p, value in sorted(section.items()):
+        lines.append('    /* swept parameter */ "%s" : %s,' %
+                     (p, json.dumps(value)))
+    lines[-1] = lines[-1].rstrip(',')
+    lines.append('}}')
+    config_file = os.path.join(tmp, 'config.json')
+    with open(config_file, 'w') as f:
+        f.write('\n'.join(lines))
+    cache_file = os.path.join(tmp, '.config.json' + Config.CACHE_SUFFIX)
+
+    def parse():
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+        Config(config_file, 'simulation')
+    results['config.parse'] = throughput(parse, 1, repeat)
+    results['config.parse_cached'] = \
+        throughput(lambda: Config(config_file, 'simulation'), 1, repeat)
+
+    config = Config(config_file, 'simulation')
+    runs = config.get_runs_count()
+    step = runs // n
+
+    def decode():
+        for i in range(n):
+            config.set_run_number(i * step)
+            config.get_param('seed')
+    results['config.decode'] = throughput(decode, n, repeat)
+
+
+def bench_log(results, tmp, n, repeat):
+    allocation = Allocation('node-0', 0.5, 10240.0, 5120.0, 5.0,
+                            {'memory': {'used': 1024.0}})
+    request = DeploymentRequest('benchmark', 10240.0,
+                                [{'name': 'memory', 'amount': 1024.0}])
+
+    def write(logger):
+        for i in range(n):
+            if i % 10:
+                logger.log_allocation(allocation, 'memory')
+            else:
+                logger.log_failure(request)
+        logger.close()
+
+    output = os.path.join(tmp, 'log')
+    results['log.csv'] = \
+        throughput(lambda: write(Log(output + '.csv')), n, repeat)
+
+    records = output + RecordLog.EXTENSION
+    results['log.records'] = \
+        throughput(lambda: write(RecordLog(records, SIMULATION)), n, repeat)
+    try:
+        import pyarrow
+    except ImportError:
+        return
+    results['log.parquet'] = throughput(
+        lambda: write(ParquetLog(output + '.parquet', SIMULATION)), n, repeat)
+
+
+def bench_simulation(results, repeat):
+    # the seed is fixed, so every repetition performs the same allocations
+    allocations = len(simulate(SIMULATION)['accepted'])
+    results['sim.local'] = \
+        throughput(lambda: simulate(SIMULATION), allocations, repeat)
+
+
+def bench_process(results, tmp, size, repeat):
+    # synthetic outputs, written in chunks to bound memory usage
+    rows = max(1, int(size * 1e6 / 70))
+    files = 4
+    chunk = 1000000
+    names = []
+    for i in range(files):
+        name = os.path.join(tmp, 'output_%d.csv' % i)
+        names.append(name)
+        with open(name, 'w') as f:
+            f.write(','.join(Log.COLUMNS) + '\n')
+            for start in range(0, rows // files, chunk):
+                n = min(chunk, rows // files - start)
+                data = np.column_stack([
+                    np.random.randint(0, 2, n), np.random.uniform(256, 2048, n),
+                    np.random.randint(0, 1000, n), np.random.uniform(0, 1, n),
+                    np.random.uniform(0, 1e4, n), np.random.uniform(0, 1e4, n),
+                    np.random.uniform(0, 10, n)])
+                np.savetxt(f, data, delimiter=',',
+                           fmt='%d,%f,node-%d,%f,%f,%f,%f')
+    process = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'process.py')
+
+    # each repetition gets an empty cache, or all but the first one would
+    # only load the cached results
+    def run():
+        cache_dir = tempfile.mkdtemp(dir=tmp)
+        subprocess.check_call([sys.executable, process, '--cache-dir',
+                               cache_dir] + names, cwd=tmp)
+    results['process.rows'] = throughput(run, rows, repeat)
+
+
+def compare(results, baseline, tolerance):
+    regressions = 0
+    print('%-40s %14s %14s %8s' % ('benchmark', 'baseline', 'current',
+                                    'ratio'))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name]
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = ' REGRESSION'
+            regressions += 1
+        print('%-40s %14.1f %14.1f %8.2f%s' % (name, baseline[name],
+                                               results[name], ratio, flag))
+    return regressions
+
+
+parser = argparse.ArgumentParser(description='Benchmark the simulator hot '
+                                             'paths. Results are throughputs '
+                                             'in operations per second')
+parser.add_argument('--only', type=str, nargs='+',
+                    choices=['distribution', 'config', 'log', 'sim',
+                             'process'],
+                    help='Run only the given benchmarks')
+parser.add_argument('-n', type=int, default=100000,
+                    help='Operations per benchmark (default: %(default)s)')
+parser.add_argument('--repeat', type=int, default=3,
+                    help='Repetitions, the best one is kept '
+                         '(default: %(default)s)')
+parser.add_argument('--process-size', type=float, default=100,
+                    help='Size in MB of the synthetic outputs given to '
+                         'process.py (default: %(default)s)')
+parser.add_argument('--save', type=str,
+                    help='Save the results as a JSON baseline')
+parser.add_argument('--compare', type=str,
+                    help='Compare the results with a JSON baseline and exit '
+                         'with an error on regressions')
+parser.add_argument('--tolerance', type=float, default=0.1,
+                    help='Relative slowdown reported as a regression '
+                         '(default: %(default)s)')
+
+args = parser.parse_args()
+only = args.only or ['distribution', 'config', 'log', 'sim', 'process']
+
+np.random.seed(0)
+results = {}
+tmp = tempfile.mkdtemp()
+try:
+    if 'distribution' in only:
+        bench_distribution(results, args.n, args.repeat)
+    if 'config' in only:
+        bench_config(results, tmp, args.n, args.repeat)
+    if 'log' in only:
+        bench_log(results, tmp, args.n, args.repeat)
+    if 'sim' in only:
+        bench_simulation(results, args.repeat)
+    if 'process' in only:
+        bench_process(results, tmp, args.process_size, args.repeat)
+finally:
+    shutil.rmtree(tmp)
+
+if args.save:
+    with open(args.save, 'w') as f:
+        json.dump({'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'n': args.n,
+                   'results': results}, f, indent=2, sort_keys=True)
+
+if args.compare:
+    with open(args.compare) as f:
+        baseline = json.load(f)['results']
+    sys.exit(1 if compare(results, baseline, args.tolerance) else 0)
+
+for name in sorted(results):
+    print('%-40s %14.1f' % (name, results[name]))
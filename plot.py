@@ -1,61 +1,145 @@
 import argparse
+import hashlib
+import os
+import multiprocessing
+import sys
+import numpy as np
 import pandas as pd
 from os.path import basename
+import matplotlib
+# figures are only saved to files, possibly from worker processes
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from itertools import cycle
+from itertools import cycle, islice
 from scipy.interpolate import interp1d
 from scipy import linspace
 
 parser = argparse.ArgumentParser(description='Plot results')
 parser.add_argument('results', type=str, nargs='?',
                     help='The aggregated result file')
+parser.add_argument('--points', type=int, default=2000,
+                    help='Maximum number of points plotted or interpolated '
+                         'per curve, at least 4 (default: %(default)s)')
+parser.add_argument('--cache-dir', type=str, default='.plot_cache',
+                    help='Directory caching the interpolated curves '
+                         '(default: %(default)s)')
 
 args = parser.parse_args()
-
-data = pd.DataFrame()
-
-df = pd.read_pickle(args.results)
+# cubic interpolation needs at least 4 points
+if args.points < 4:
+    parser.error('--points must be at least 4')
 
 lines = [":","-.","--","-"]
-linecycler = cycle(lines)
 
-for label, grp in df.groupby('scarcity'):
+# downsamples a curve to at most threshold points with the Largest Triangle
+# Three Buckets algorithm, which keeps the points that preserve its visual shape
+def lttb(x, y, threshold):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # first and last points are always kept, the others are split in buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket, or the last point for the last bucket
+        if i + 2 < len(edges):
+            next_end = edges[i + 2]
+        else:
+            next_end = n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # keep the point forming the largest triangle with the previously
+        # selected point and the average of the next bucket
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + np.argmax(area)
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+# interpolates utility as a function of utilization, caching the curve under a
+# hash of the group data
+def interpolate(grp):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(
+        grp[['utilization', 'utility']], index=False).values.tobytes())
+    digest.update(str(args.points).encode('utf-8'))
+    cache_file = os.path.join(args.cache_dir, digest.hexdigest() + '.npz')
+    if os.path.exists(cache_file):
+        cached = np.load(cache_file)
+        return cached['x'], cached['y']
+
     grp = grp.drop_duplicates(subset=['utilization']).sort_values(by=['utilization'])
+    x, y = lttb(grp['utilization'].values, grp['utility'].values, args.points)
+
+    interp = interp1d(x, y, kind='cubic')
 
-    interp = interp1d(grp['utilization'], grp['utility'], kind='cubic')
+    xnew = linspace(x.min(), x.max(), num=100)
+    ynew = interp(xnew)
 
-    xnew = linspace(grp['utilization'].min(), grp['utilization'].max(),
-                    num=100)
+    if not os.path.isdir(args.cache_dir):
+        os.makedirs(args.cache_dir)
+    np.savez(cache_file, x=xnew, y=ynew)
+    return xnew, ynew
 
-    plt.plot(xnew, interp(xnew) ,
-             linestyle=next(linecycler), linewidth=0.8, label="scarcity=%s" % label)
+def plot_welfare(df, offset):
+    linecycler = islice(cycle(lines), offset, None)
 
-    plt.fill_between(xnew, interp(xnew), 0, alpha=0.2, color='grey', linewidth=0.5)
+    for label, grp in df.groupby('scarcity'):
+        xnew, ynew = interpolate(grp)
 
-plt.legend(loc='upper left')
+        plt.plot(xnew, ynew ,
+                 linestyle=next(linecycler), linewidth=0.8, label="scarcity=%s" % label)
 
-plt.xlim(df['utilization'].min(), df['utilization'].max())
-plt.xlabel('utilization')
-plt.ylim(0, 10)
-plt.ylabel('unit price')
+        plt.fill_between(xnew, ynew, 0, alpha=0.2, color='grey', linewidth=0.5)
 
-plt.savefig('welfare.pdf')
+    plt.legend(loc='upper left')
 
-plt.clf()
+    plt.xlim(df['utilization'].min(), df['utilization'].max())
+    plt.xlabel('utilization')
+    plt.ylim(0, 10)
+    plt.ylabel('unit price')
 
-for label, grp in df.groupby('scarcity'):
-    deployments = range(0, len(grp))
+    plt.savefig('welfare.pdf')
 
-    plt.step(deployments, grp['utility'],
-             linestyle=next(linecycler), linewidth=0.8, label="scarcity=%s" % label)
+def plot_welfare_cluster(df, offset):
+    linecycler = islice(cycle(lines), offset, None)
 
-    plt.fill_between(deployments, grp['utility'], 0, step="pre", alpha=0.2, color='grey', linewidth=0.5)
+    for label, grp in df.groupby('scarcity'):
+        deployments, utility = lttb(np.arange(len(grp)), grp['utility'].values,
+                                    args.points)
 
-plt.legend(loc='upper left')
+        plt.step(deployments, utility,
+                 linestyle=next(linecycler), linewidth=0.8, label="scarcity=%s" % label)
 
-plt.xlim(0, max(df.groupby('scarcity').count()['utility'])-1)
-plt.xlabel('deployments')
-plt.ylim(0, 10)
-plt.ylabel('unit price')
+        plt.fill_between(deployments, utility, 0, step="pre", alpha=0.2, color='grey', linewidth=0.5)
+
+    plt.legend(loc='upper left')
+
+    plt.xlim(0, max(df.groupby('scarcity').count()['utility'])-1)
+    plt.xlabel('deployments')
+    plt.ylim(0, 10)
+    plt.ylabel('unit price')
+
+    plt.savefig('welfare_cluster.pdf')
+
+df = pd.read_pickle(args.results)
 
-plt.savefig('welfare_cluster.pdf')
+# both figures take line styles from the same cycle, the second one continuing
+# where the first one ended
+groups = df['scarcity'].nunique()
+figures = [multiprocessing.Process(target=plot_welfare, args=(df, 0)),
+           multiprocessing.Process(target=plot_welfare_cluster,
+                                   args=(df, groups))]
+for figure in figures:
+    figure.start()
+for figure in figures:
+    figure.join()
+# a figure that failed to plot fails the whole script
+if any(figure.exitcode != 0 for figure in figures):
+    sys.exit(1)
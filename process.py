@@ -1,38 +1,144 @@
 import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
 import pandas as pd
 import numpy as np
 from os.path import basename
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'simulator'))
+from log import Log, RecordLog
+
 PARAMS = ['scarcity']
 
-# splits the name of an output file by _ and extracts the values of simulation parameters
-def get_params(filename):
-    params = basename(filename).rstrip('.csv').split("_")[1:]
-    out = {}
-    for i in range(len(params)):
-        out[PARAMS[i]] = float(params[i])
-    return out
+# column types of the output files
+DTYPES = {'accepted': np.int8, 'size': np.float64, 'node': object,
+          'utilization': np.float64, 'offer': np.float64,
+          'price': np.float64, 'unit_price': np.float64}
+
+# extracts the values of simulation parameters of every output file, one row
+# per file. values are read from the file name, split by _, and for parquet
+# and record files from their metadata, which takes precedence for the
+# parameters it has
+def get_params(filenames):
+    names = pd.Series([basename(f) for f in filenames])
+    parquet = names.str.endswith('.parquet')
+    records = names.str.endswith(RecordLog.EXTENSION)
+    params = names.str.replace(r'\.[^.]*$', '').str.split('_', expand=True)
+    # parts of the name that are not numbers are not parameter values
+    params = params.iloc[:, 1:len(PARAMS) + 1] \
+        .apply(pd.to_numeric, errors='coerce')
+    params.columns = PARAMS[:params.shape[1]]
+    params = params.reindex(index=names.index, columns=PARAMS)
+
+    if parquet.any():
+        import pyarrow.parquet as pq
+        for i in names.index[parquet]:
+            metadata = pq.read_schema(filenames[i]).metadata
+            values = json.loads(metadata[b'params'].decode('utf-8'))
+            for p in PARAMS:
+                if p in values:
+                    params.at[i, p] = float(values[p])
+
+    for i in names.index[records]:
+        values = RecordLog.read_header(filenames[i])['params']
+        for p in PARAMS:
+            if p in values:
+                params.at[i, p] = float(values[p])
+
+    return params.dropna(axis=1, how='all')
+
+# reads an output file, written as csv, parquet or fixed-width records, one
+# chunk of rows at a time. record files are memory mapped, so only the records
+# of the current chunk are read
+def read_chunks(filename, chunksize):
+    if filename.endswith(RecordLog.EXTENSION):
+        records = RecordLog.read(filename)
+        for start in range(0, len(records), chunksize):
+            chunk = records[start:start + chunksize]
+            columns = dict((c, chunk[c]) for c in Log.COLUMNS if c != 'node')
+            # failures have no node, like the empty field of csv files
+            columns['node'] = pd.Series(chunk['node']).str.decode('utf-8') \
+                .replace('', np.nan)
+            yield pd.DataFrame(columns, columns=Log.COLUMNS)
+    elif filename.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(filename)
+        for i in range(parquet.num_row_groups):
+            yield parquet.read_row_group(i).to_pandas()
+    else:
+        for chunk in pd.read_csv(filename, dtype=DTYPES, chunksize=chunksize):
+            yield chunk
+
+# returns the cache file of the processed deployments of an output file. the
+# cache is invalidated when path, size or modification time of the file change
+def get_cache_file(cache_dir, filename):
+    stat = os.stat(filename)
+    key = '%s:%d:%r:%s' % (os.path.abspath(filename), stat.st_size,
+                           stat.st_mtime, ','.join(PARAMS))
+    return os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
+
+# processes an output file chunk by chunk, keeping only the accepted
+# deployments and computing derived columns, unless it is already cached.
+# returns the cache file holding the result
+def process(task):
+    filename, params, chunksize, cache_dir = task
+    cache_file = get_cache_file(cache_dir, filename)
+    if os.path.exists(cache_file):
+        return cache_file
+
+    chunks = []
+    for chunk in read_chunks(filename, chunksize):
+        chunk = chunk[chunk.accepted == 1].copy()
+        # every deployment takes the parameters of the file it comes from
+        for name, val in params.items():
+            chunk[name] = val
+        # Calculate utility of each deployment
+        chunk['utility'] = chunk['unit_price']
+        chunks.append(chunk)
+    if chunks:
+        data = pd.concat(chunks, ignore_index=True)
+    else:
+        # the file has no rows (yet), keep the columns of the other files
+        data = pd.DataFrame(columns=Log.COLUMNS + list(params) + ['utility'])
+
+    # write and rename, so an interrupted run never leaves a partial cache
+    data.to_pickle(cache_file + '.tmp')
+    os.rename(cache_file + '.tmp', cache_file)
+    return cache_file
 
 parser = argparse.ArgumentParser(description='Process simulation data.')
 parser.add_argument('in_files', type=str, nargs='+',
                     help='The data input files')
+parser.add_argument('-j', '--jobs', type=int,
+                    default=multiprocessing.cpu_count(),
+                    help='Number of files processed in parallel '
+                         '(default: %(default)s)')
+parser.add_argument('--chunksize', type=int, default=1000000,
+                    help='Rows of a csv file processed at once '
+                         '(default: %(default)s)')
+parser.add_argument('--cache-dir', type=str, default='.process_cache',
+                    help='Directory caching the processed deployments of '
+                         'each input file (default: %(default)s)')
 
 args = parser.parse_args()
 
-#Load Data
-df = pd.DataFrame()
-for filename in args.in_files:
-    csv = pd.read_csv(filename)
-
-    params = get_params(filename)
-    for name, val in params.items():
-        csv[name] = val
+if not os.path.isdir(args.cache_dir):
+    os.makedirs(args.cache_dir)
 
-    df = df.append(csv, ignore_index=True)
+params = get_params(args.in_files)
+tasks = [(filename, params.iloc[i].to_dict(), args.chunksize, args.cache_dir)
+         for i, filename in enumerate(args.in_files)]
 
-df = df[df.accepted == 1]
+#Load Data
+pool = multiprocessing.Pool(args.jobs)
+cache_files = pool.map(process, tasks)
+pool.close()
+pool.join()
 
-# Calculate utility of each deployment
-df['utility'] = df.apply(lambda x : x.unit_price, axis=1)
+df = pd.concat([pd.read_pickle(f) for f in cache_files], ignore_index=True)
 
 df.to_pickle("./utilities.pkl")
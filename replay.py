@@ -0,0 +1,140 @@
+import argparse
+import itertools
+import os
+import numpy as np
+import pandas as pd
+
+# pricing policies: unit price of a node as a function of its utilization
+# after the allocation. all arguments are arrays with one value per variant
+PRICING = {
+    # same as the local backend of the simulator
+    'exp': lambda u, base_price, scarcity: base_price * np.exp(scarcity * u),
+    'linear': lambda u, base_price, scarcity: base_price * (1 + scarcity * u),
+    'poly': lambda u, base_price, scarcity: base_price * (1 + u) ** scarcity,
+}
+
+# placement policies: index of the node chosen for every variant, given the
+# used resources of each node (variants x nodes), the capacity of the nodes and
+# the size of the deployment
+PLACEMENT = {
+    # least utilized node, same as the local backend of the simulator. nodes
+    # are homogeneous, so if the deployment does not fit there it does not fit
+    # anywhere
+    'least': lambda used, capacity, size: used.argmin(axis=1),
+    # most utilized node on which the deployment fits (best fit)
+    'most': lambda used, capacity, size:
+        np.where(used + size <= capacity, used, -np.inf).argmax(axis=1),
+}
+
+# reads the request stream (size and offer of every request, accepted or not)
+# from an output file, written either as csv or as parquet
+def read_requests(filename):
+    if filename.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        data = pq.read_table(filename, columns=['size', 'offer']).to_pandas()
+    else:
+        data = pd.read_csv(filename, usecols=['size', 'offer'])
+    return data['size'].values.astype(float), data['offer'].values.astype(float)
+
+# replays a request stream against a cluster for several variants of a pricing
+# policy at once. returns, for each request and variant, the same values the
+# simulator logs: accepted, node, utilization, price and unit price
+def replay(sizes, offers, nodes, capacity, pricing, placement, base_price,
+           scarcity):
+    variants = len(base_price)
+    requests = len(sizes)
+    rows = np.arange(variants)
+    used = np.zeros((variants, nodes))
+
+    accepted = np.zeros((requests, variants), dtype=np.int8)
+    node = np.zeros((requests, variants), dtype=int)
+    utilization = np.zeros((requests, variants))
+    unit_price = np.zeros((requests, variants))
+
+    for i in range(requests):
+        size = sizes[i]
+        chosen = placement(used, capacity, size)
+        after = used[rows, chosen] + size
+        u = after / capacity
+        price_u = pricing(u, base_price, scarcity)
+        ok = (after <= capacity) & (price_u * size <= offers[i])
+        used[rows[ok], chosen[ok]] = after[ok]
+
+        accepted[i] = ok
+        node[i] = chosen
+        utilization[i] = u
+        unit_price[i] = price_u
+
+    price = unit_price * sizes[:, np.newaxis]
+    return accepted, node, utilization, price, unit_price
+
+# writes the replay of a variant with the columns of the simulator output
+def write_output(filename, sizes, offers, accepted, node, utilization, price,
+                 unit_price):
+    ok = accepted == 1
+    df = pd.DataFrame({'accepted': accepted,
+                       'size': sizes,
+                       'node': np.where(ok, np.char.add('node-', node.astype(str)), ''),
+                       'utilization': np.where(ok, utilization, np.nan),
+                       'offer': offers,
+                       'price': np.where(ok, price, np.nan),
+                       'unit_price': np.where(ok, unit_price, np.nan)},
+                      columns=['accepted', 'size', 'node', 'utilization',
+                               'offer', 'price', 'unit_price'])
+    df.to_csv(filename, index=False, float_format='%f')
+
+parser = argparse.ArgumentParser(description='Replay the requests of a '
+                                             'simulation against alternative '
+                                             'pricing and placement policies, '
+                                             'without a cluster')
+parser.add_argument('in_file', type=str,
+                    help='The simulation output with the requests to replay')
+parser.add_argument('--nodes', type=int, required=True,
+                    help='Number of nodes of the cluster')
+parser.add_argument('--node-capacity', type=float, required=True,
+                    help='Allocatable resource per node, in the unit of the '
+                         'size column')
+parser.add_argument('--pricing', type=str, default='exp',
+                    choices=sorted(PRICING.keys()),
+                    help='Pricing policy (default: %(default)s)')
+parser.add_argument('--placement', type=str, default='least',
+                    choices=sorted(PLACEMENT.keys()),
+                    help='Placement policy (default: %(default)s)')
+parser.add_argument('--base-price', type=float, nargs='+', default=[1.0],
+                    help='Unit prices of an empty node (default: %(default)s)')
+parser.add_argument('--scarcity', type=float, nargs='+', default=[1.0],
+                    help='Growth rates of the unit price with the '
+                         'utilization (default: %(default)s)')
+parser.add_argument('--output', type=str,
+                    default='replay_{scarcity}_{base_price}.csv',
+                    help='Output file name of each variant, with the '
+                         'variant parameters in braces (default: '
+                         '%(default)s)')
+
+args = parser.parse_args()
+
+# every combination of the policy parameters is a variant
+variants = list(itertools.product(args.base_price, args.scarcity))
+base_price = np.array([v[0] for v in variants])
+scarcity = np.array([v[1] for v in variants])
+
+# every variant needs its own output file
+filenames = [args.output.format(base_price=base_price[v],
+                                scarcity=scarcity[v],
+                                pricing=args.pricing,
+                                placement=args.placement)
+             for v in range(len(variants))]
+if len(set(filenames)) < len(filenames):
+    raise SystemExit('The output template %s gives the same name to '
+                     'different variants' % args.output)
+
+sizes, offers = read_requests(args.in_file)
+
+results = replay(sizes, offers, args.nodes, args.node_capacity,
+                 PRICING[args.pricing], PLACEMENT[args.placement],
+                 base_price, scarcity)
+
+for v, filename in enumerate(filenames):
+    if os.path.exists(filename) and os.path.samefile(filename, args.in_file):
+        raise SystemExit('Refusing to overwrite the input file %s' % filename)
+    write_output(filename, sizes, offers, *[r[:, v] for r in results])
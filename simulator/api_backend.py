@@ -0,0 +1,104 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import swagger_client
+from swagger_client.rest import ApiException
+from swagger_client.configuration import Configuration
+
+
+class ApiBackend:
+    """
+    Cluster backend that forwards every request to the pricing API of a live
+    deployment through the generated swagger client
+    """
+
+    # API endpoint
+    ENDPOINT = "endpoint"
+    # number of requests in flight at the same time
+    WINDOW = "window"
+    # number of parallel deletions at teardown
+    TEARDOWN_WORKERS = "teardown_workers"
+
+    def __init__(self, config):
+        """
+        Constructor
+        :param config: the simulation configuration
+        """
+        configuration = Configuration()
+        configuration.host = config.get_param(ApiBackend.ENDPOINT)
+        # one pooled connection per request in flight or parallel deletion
+        size = max(int(config.get_param(ApiBackend.WINDOW, 1)),
+                   int(config.get_param(ApiBackend.TEARDOWN_WORKERS, 8)))
+        if size > getattr(configuration, 'connection_pool_maxsize', size):
+            configuration.connection_pool_maxsize = size
+        self.api = swagger_client.DeploymentsApi()
+        self.nodes_api = swagger_client.NodesApi()
+
+    def create_request(self, application, offer, resource, amount):
+        """
+        Builds a deployment request for the given application
+        :param application: the application to deploy
+        :param offer: the offer for the whole deployment
+        :param resource: the requested resource
+        :param amount: amount of resource to request (not scaled)
+        :returns: the deployment request
+        """
+        return swagger_client.DeploymentRequest(application, str(offer),
+                                                [{'name': resource,
+                                                  'amount': str(amount)}])
+
+    def put_deployment(self, name, request):
+        """
+        Requests a deployment
+        :param name: the deployment name
+        :param request: the deployment request
+        :returns: the allocation or None if the request was rejected
+        """
+        try:
+            return self.api.put_deployment(name, request)
+        except ApiException:
+            return None
+
+    def delete_deployment(self, name):
+        """
+        Deletes a deployment
+        :param name: the deployment name
+        :returns: whether the deployment has been deleted
+        """
+        try:
+            self.api.delete_deployment(name)
+            return True
+        except ApiException:
+            return False
+
+    def get_nodes(self):
+        """
+        Returns the nodes of the cluster
+        """
+        return self.nodes_api.get_nodes_collection().nodes
+
+    def get_state(self):
+        """
+        Returns the state to store in a checkpoint. The deployments live on
+        the cluster, so there is nothing to store
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores the state stored in a checkpoint
+        :param state: the state returned by get_state()
+        """
+        pass
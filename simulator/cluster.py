@@ -13,95 +13,433 @@
 #
 # Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
 
+import heapq
+import sys
 import time
-import sim
-from distribution import Distribution
-
-import swagger_client
-from swagger_client.rest import ApiException
-from swagger_client.configuration import Configuration
+import threading
+from array import array
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from distribution import Distribution, derive_seed
+from convergence import Convergence
+from local_backend import LocalBackend
+from workload import Trace
 
 class Cluster:
     """
-    This class allocates resources on the cluster by calling the cluster API
+    This class allocates resources on the cluster through a backend, either the
+    cluster API or an in-memory model of the cluster
     """
 
+    SEED = "seed"
     SIZE = "size"
     OFFER = "offer"
     APPLICATION = "application"
-    ENDPOINT = "endpoint"
     RESOURCE = "resource"
     RESOURCE_SCALE = "resource_scale"
+    BACKEND = "backend"
+    RECONCILE_INTERVAL = "reconcile_interval"
+    WINDOW = "window"
+    TEARDOWN = "teardown"
+    TEARDOWN_WORKERS = "teardown_workers"
+    CONVERGENCE = "convergence"
+    TRACE = "trace"
+
+    # backend calling the cluster API through the swagger client
+    BACKEND_API = "api"
+    # backend calling the cluster API over pooled HTTP connections
+    BACKEND_HTTP = "http"
+    # backend simulating the cluster in memory
+    BACKEND_LOCAL = "local"
+
+    # delete deployments before the simulation ends
+    TEARDOWN_FOREGROUND = "foreground"
+    # delete deployments in a separate thread, letting the simulation end
+    TEARDOWN_BACKGROUND = "background"
+
+    # requests that may have been sent after a checkpoint without their
+    # result reaching the output file, e.g., still buffered when the run was
+    # killed
+    RECOVERY_MARGIN = 1024
 
-    def __init__(self):
-        self.sim = sim.Sim.Instance()
-        self.logger = self.sim.get_logger()
-        self.requests = []
+    # teardown threads still running in the background
+    teardowns = []
+
+    def __init__(self, logger):
+        """
+        Constructor
+        :param logger: data logger receiving the result of every allocation
+        """
+        self.logger = logger
+        # indexes of the accepted deployments, from which their names can be
+        # rebuilt at teardown
+        self.requests = array('L')
 
     def initialize(self, config):
         self.run_number = config.run_number
         self.application = config.get_param(Cluster.APPLICATION)
-        self.size = Distribution(config.get_param(Cluster.SIZE))
-        self.offer = Distribution(config.get_param(Cluster.OFFER))
+        # every distribution draws from its own stream derived from the seed
+        seed = config.get_param(Cluster.SEED)
+        self.size = Distribution(config.get_param(Cluster.SIZE),
+                                 derive_seed(seed, Cluster.SIZE))
+        self.offer = Distribution(config.get_param(Cluster.OFFER),
+                                  derive_seed(seed, Cluster.OFFER))
+        # optional recorded requests, replacing the values drawn from the
+        # size and offer distributions
+        self.trace = None
+        trace_file = config.get_param(Cluster.TRACE, "")
+        if trace_file:
+            self.trace = Trace(trace_file)
         self.resource = config.get_param(Cluster.RESOURCE)
         self.resource_scale = int(config.get_param(Cluster.RESOURCE_SCALE))
-        Configuration().host = config.get_param(Cluster.ENDPOINT)
-        self.api = swagger_client.DeploymentsApi()
-        self.nodes_api = swagger_client.NodesApi()
+
+        backend = config.get_param(Cluster.BACKEND, Cluster.BACKEND_API)
+        # whether deployments live on a cluster rather than in memory
+        self.remote = backend != Cluster.BACKEND_LOCAL
+        if backend == Cluster.BACKEND_API:
+            # imported here so that local runs do not need the swagger client
+            from api_backend import ApiBackend
+            self.backend = ApiBackend(config)
+        elif backend == Cluster.BACKEND_HTTP:
+            from http_backend import HttpBackend
+            self.backend = HttpBackend(config)
+        elif backend == Cluster.BACKEND_LOCAL:
+            self.backend = LocalBackend(config)
+        else:
+            print("Cluster error: unknown backend %s" % backend)
+            sys.exit(1)
+
+        # number of allocations between two synchronizations of the local view
+        # of node capacity with the cluster. 0 never synchronizes again
+        self.reconcile_interval = int(config.get_param(
+            Cluster.RECONCILE_INTERVAL, 0))
+        self.reconciliations = 0
+        self.max_drift = 0
+        # whether a reconciliation waits for the requests in flight, which
+        # the cluster may have placed already, to be committed
+        self.reconcile_due = False
+
+        # node name -> free resources (not scaled), updated after every
+        # allocation instead of being fetched from the cluster
+        self.set_free(self.fetch_free_resources())
+
+        # number of allocation requests kept in flight at the same time. the
+        # local backend answers immediately and is not thread safe, so it is
+        # always used sequentially
+        self.window = int(config.get_param(Cluster.WINDOW, 1))
+        if backend == Cluster.BACKEND_LOCAL:
+            self.window = 1
+        if self.window > 1:
+            self.pool = ThreadPool(self.window)
+        # requests sent but not committed yet, oldest first
+        self.in_flight = deque()
+
+        self.teardown_mode = config.get_param(Cluster.TEARDOWN,
+                                              Cluster.TEARDOWN_FOREGROUND)
+        self.teardown_workers = int(config.get_param(Cluster.TEARDOWN_WORKERS,
+                                                     8))
+        if backend == Cluster.BACKEND_LOCAL:
+            self.teardown_workers = 1
+        # deleted and failed deployments so far
+        self.deleted = 0
+        self.teardown_failures = []
+
+        # optional criterion for stopping before the halting threshold
+        self.convergence = None
+        convergence = config.get_param(Cluster.CONVERGENCE, {})
+        if convergence:
+            self.convergence = Convergence(convergence)
 
         self.index = 0
+        # number of allocation results committed so far
+        self.committed = 0
+
+    def finalize(self, progress=None):
+        """
+        Deletes all the accepted deployments, either right away or in a
+        background thread depending on the teardown parameter
+        :param progress: optional function called with the number of deleted
+        deployments, the number of failed deletions and the total number of
+        deployments while deleting in the foreground
+        """
+        if self.window > 1:
+            self.pool.close()
+        if self.teardown_mode == Cluster.TEARDOWN_BACKGROUND:
+            thread = threading.Thread(target=self.background_teardown)
+            thread.start()
+            Cluster.teardowns.append(thread)
+        else:
+            self.teardown(progress)
+
+    def background_teardown(self):
+        """
+        Deletes all the accepted deployments and prints the outcome, as no
+        summary is printed after a teardown in the background
+        """
+        self.teardown()
+        print("Run %s: deleted %d deployments in the background (%d failed)" %
+              (self.run_number, self.deleted, len(self.teardown_failures)))
+        if self.teardown_failures:
+            print("Run %s: failed to delete %s" %
+                  (self.run_number, ", ".join(self.teardown_failures)))
+        sys.stdout.flush()
+
+    def teardown(self, progress=None):
+        """
+        Deletes all the accepted deployments using up to teardown_workers
+        parallel requests
+        :param progress: optional function called at most once per second with
+        the number of deleted deployments, the number of failed deletions and
+        the total number of deployments
+        """
+        names = ["test-%s-%s" % (self.run_number, i) for i in self.requests]
+        prev_time = time.time()
+        for i, deleted in enumerate(self.delete_deployments(names)):
+            if deleted:
+                self.deleted += 1
+            else:
+                self.teardown_failures.append(names[i])
+            if progress is not None and time.time() - prev_time >= 1:
+                progress(self.deleted, len(self.teardown_failures), len(names))
+                prev_time = time.time()
+        self.requests = array('L')
 
-    def finalize(self):
-        for app in self.requests:
+    def delete_deployments(self, names):
+        """
+        Deletes deployments using up to teardown_workers parallel requests
+        :param names: the names of the deployments
+        :returns: a generator of the results of the deletions, in order
+        """
+        if self.teardown_workers > 1:
+            pool = ThreadPool(self.teardown_workers)
             try:
-                self.api.delete_deployment(app)
-            except ApiException:
-                pass
+                for deleted in pool.imap(self.backend.delete_deployment, names,
+                                         chunksize=16):
+                    yield deleted
+            finally:
+                pool.close()
+        else:
+            for name in names:
+                yield self.backend.delete_deployment(name)
+
+    def recover(self, count):
+        """
+        After restoring a checkpoint, deletes the deployments that the run
+        may have created on the cluster after the checkpoint, which the
+        restored state does not know about, and replaces the restored view of
+        node capacity with the one of the cluster
+        :param count: number of requests that may have been sent after the
+        checkpoint
+        :returns: the number of deleted deployments
+        """
+        names = ["test-%s-%s" % (self.run_number, i)
+                 for i in range(self.index, self.index + count)]
+        deleted = 0
+        for result in self.delete_deployments(names):
+            if result:
+                deleted += 1
+        self.set_free(self.fetch_free_resources())
+        return deleted
+
+    @staticmethod
+    def wait_teardowns():
+        """
+        Waits for the teardowns running in the background to complete
+        """
+        while Cluster.teardowns:
+            Cluster.teardowns.pop().join()
 
     def request_allocation(self):
+        """
+        Requests an allocation and commits its result. With a window larger
+        than 1, the window is first filled with new requests and then the
+        oldest one is committed, so results are committed in request order.
+        While a reconciliation is due, no new request is sent until the
+        window is empty
+        :returns: whether the committed allocation was accepted
+        """
+        if self.window == 1:
+            pending = self.prepare_allocation()
+            allocation = self.backend.put_deployment(pending[0], pending[1])
+            return self.commit_allocation(pending, allocation)
+
+        while not self.reconcile_due and len(self.in_flight) < self.window:
+            pending = self.prepare_allocation()
+            result = self.pool.apply_async(self.backend.put_deployment,
+                                           pending[:2])
+            self.in_flight.append((pending, result))
+        pending, result = self.in_flight.popleft()
+        return self.commit_allocation(pending, result.get())
+
+    def drain(self):
+        """
+        Waits for the requests still in flight and commits their results
+        :returns: the list of results, as returned by request_allocation()
+        """
+        results = []
+        while self.in_flight:
+            pending, result = self.in_flight.popleft()
+            results.append(self.commit_allocation(pending, result.get()))
+        return results
 
+    def prepare_allocation(self):
+        """
+        Draws size and offer of the next deployment and builds its request
+        :returns: a tuple (name, request, scaled size, raw size, index)
+        :raises TraceEnded: if the requests of the trace have all been used
+        """
+        if self.trace is not None:
+            scaled_size, unity_offer = self.trace.get_request(self.index)
         app_name = "test-%s-%s" % (self.run_number, self.index)
         self.index += 1
 
-        unity_offer = self.offer.get_value()
-
-        scaled_size = self.size.get_value()
+        if self.trace is None:
+            unity_offer = self.offer.get_value()
+            scaled_size = self.size.get_value()
 
         # Offer for the requested size (same magnitude)
         offer = scaled_size * unity_offer
 
         raw_size = scaled_size * self.resource_scale
-        request = swagger_client.DeploymentRequest(self.application,
-                                                   str(offer),
-                                                   [{'name': self.resource, 'amount': str(raw_size) }])
+        request = self.backend.create_request(self.application, offer,
+                                              self.resource, raw_size)
 
-        self.requests.append(app_name)
+        return app_name, request, scaled_size, raw_size, self.index - 1
 
-        # Request an application deployment
-        try:
-            allocation = self.api.put_deployment(app_name, request)
+    def commit_allocation(self, pending, allocation):
+        """
+        Logs the result of an allocation request and updates the local view
+        of node capacity
+        :param pending: the request, as returned by prepare_allocation()
+        :param allocation: the allocation or None if the request was rejected
+        :returns: whether the allocation was accepted
+        """
+        app_name, request, scaled_size, raw_size, index = pending
+        if allocation is not None:
+            self.requests.append(index)
+            self.update_free(allocation.node, -raw_size)
             allocation.resources[self.resource]['used'] = scaled_size
             self.logger.log_allocation(allocation, self.resource)
-            return True
-        except ApiException as e:
+            result = True
+        else:
             request.resources[0]['amount'] = scaled_size
             self.logger.log_failure(request)
-            return False
+            result = False
+
+        if self.convergence is not None:
+            self.convergence.update(allocation)
+        self.committed += 1
+        if self.reconcile_interval > 0 and \
+                self.committed % self.reconcile_interval == 0:
+            self.reconcile_due = True
+        # reconcile only when no request is in flight, otherwise the fetched
+        # capacity would already include allocations not committed yet
+        if self.reconcile_due and not self.in_flight:
+            self.reconcile()
+            self.reconcile_due = False
+        return result
+
+    def set_free(self, free):
+        """
+        Replaces the local view of node capacity
+        :param free: map from node name to free resources (not scaled)
+        """
+        self.free = free
+        # max-heap of (-free, node name). Entries whose free value differs
+        # from self.free are stale and skipped when they reach the top
+        self.free_heap = [(-f, node) for node, f in free.items()]
+        heapq.heapify(self.free_heap)
+
+    def update_free(self, node, amount):
+        """
+        Updates the free resources of a node in the local view
+        :param node: the node name
+        :param amount: the amount of resources (not scaled) released, or
+        taken if negative
+        """
+        self.free[node] += amount
+        heapq.heappush(self.free_heap, (-self.free[node], node))
+        # drop the stale entries once they outnumber the valid ones
+        if len(self.free_heap) > 2 * len(self.free):
+            self.set_free(self.free)
+
+    def fetch_free_resources(self):
+        """
+        Reads the free resources of every node from the cluster
+        :returns: map from node name to free resources (not scaled)
+        """
+        free = {}
+        for node in self.backend.get_nodes():
+            free[node.name] = float(node.resources[self.resource]['free'])
+        return free
+
+    def reconcile(self):
+        """
+        Replaces the local view of node capacity with the one of the cluster,
+        keeping track of how much the two diverged
+        :returns: the drift, i.e., the total difference of free resources
+        (scaled) between the local view and the cluster
+        """
+        free = self.fetch_free_resources()
+        drift = 0
+        for node in set(free) | set(self.free):
+            drift += abs(free.get(node, 0) - self.free.get(node, 0))
+        drift /= self.resource_scale
+
+        self.set_free(free)
+        self.reconciliations += 1
+        self.max_drift = max(self.max_drift, drift)
+        return drift
+
+    def get_state(self):
+        """
+        Returns the state of the cluster to store in a checkpoint. Requests
+        in flight must be drained first
+        :returns: a dictionary with the state
+        """
+        return {"index": self.index,
+                "committed": self.committed,
+                "requests": self.requests,
+                "free": self.free,
+                "reconciliations": self.reconciliations,
+                "max_drift": self.max_drift,
+                "size": self.size.get_state(),
+                "offer": self.offer.get_state(),
+                "convergence": self.convergence,
+                "backend": self.backend.get_state()}
+
+    def set_state(self, state):
+        """
+        Restores the state stored in a checkpoint
+        :param state: the state returned by get_state()
+        """
+        self.index = state["index"]
+        self.committed = state["committed"]
+        self.requests = state["requests"]
+        self.set_free(state["free"])
+        self.reconciliations = state["reconciliations"]
+        self.max_drift = state["max_drift"]
+        self.size.set_state(state["size"])
+        self.offer.set_state(state["offer"])
+        self.convergence = state["convergence"]
+        self.backend.set_state(state["backend"])
 
     def get_expected_deployments(self):
         total = 0
         dep_size = int(self.size.get_mean())
-        for node in self.nodes_api.get_nodes_collection().nodes:
+        for node in self.backend.get_nodes():
             alloc_s = node.resources[self.resource]['allocatable'] / \
                       self.resource_scale
             total += alloc_s / dep_size
         return total
 
     def get_allocation_probability(self):
-        nodes = self.nodes_api.get_nodes_collection()
-
-        # Get smallest amount of free resources on a node
-        remaining = max([node.resources[self.resource]['free'] for node in nodes.nodes])
+        # Get the largest amount of free resources on a node, discarding
+        # stale heap entries
+        heap = self.free_heap
+        while -heap[0][0] != self.free[heap[0][1]]:
+            heapq.heappop(heap)
+        remaining = -heap[0][0]
 
         remaining /= self.resource_scale
         return self.size.get_probability(0, remaining)
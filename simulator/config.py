@@ -13,44 +13,70 @@
 #
 # Copyright (C) 2016 Michele Segata <segata@ccs-labs.org>
 
+import hashlib
 import json
+import os
 import re
 import sys
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 
 class Config:
     """
     Reads simulation config from configuration file. The configuration file is
     in JSON format with the addition of text comments (non-standard JSON).
-    Comments are automatically removed before processing the JSON content
+    Comments are automatically removed before processing the JSON content.
+    The parsed configuration is cached in a hidden file next to the config
+    file, and reused as long as the content of the config file is unchanged
     """
 
     # output file name parameter
     OUTPUT = "output"
+    # parameters that cannot affect the results of a run, so they do not
+    # identify it (see get_run_key()); anything that changes the requests
+    # sent, their order or their timing, such as the endpoint, the window or
+    # the timeouts, does
+    RUN_KEY_EXCLUDED = [OUTPUT, "teardown", "teardown_workers"]
+    # parameters naming a file whose content, rather than its path,
+    # identifies a run
+    RUN_KEY_FILES = ["trace"]
+    # size of the blocks in which such files are hashed
+    HASH_BLOCK_SIZE = 1 << 20
+    # suffix of the file caching the parsed configuration
+    CACHE_SUFFIX = ".cache"
+    # regular expression matching comments in json files
+    COMMENTS = re.compile('(^)?[^\S\n]*/(?:\*(.*?)\*/[^\S\n]*|/[^\n]*)($)?',
+                          re.DOTALL | re.MULTILINE)
+    # regular expression splitting the output template into text and variables
+    VARIABLES = re.compile('({[^{}]*})')
 
-    def __init__(self, config_file, section):
+    def __init__(self, config_file, section, cfg=None):
         """
         Constructor.
         :param config_file: file name of the config file
         :param section: the section of the configuration file to load
+        :param cfg: already parsed configuration to use instead of reading the
+        config file
         """
         # save basic configuration
         self.config_file = config_file
         self.section = section
-        # load configuration from json
-        json_content = self.remove_comments(config_file)
-        try:
-            self.cfg = json.loads(json_content)
-        except Exception as e:
-            print("Unable to parse " + self.config_file)
-            print(e.message)
-            sys.exit(1)
+        if cfg is not None:
+            self.cfg = cfg
+        else:
+            self.cfg = self.load(config_file)
         if section not in self.cfg:
             print("Error: the file %s does not contain section %s",
                   (config_file, section))
             sys.exit(1)
         # create the mapping between run numbers and parameters
         self.map_parameters()
+        # parse the output file name template once for all runs
+        self.compile_output_template()
         # set the run number to 0 by default
         self.run_number = 0
         # compute the output file name for run number 0
@@ -58,8 +84,8 @@ class Config:
 
     def map_parameters(self):
         """
-        Creates a map from run number to the index of each parameter for that
-        specific run number. For example, if we have parameters a and b, defined
+        Creates the mapping from run number to the index of each parameter for
+        that specific run number. For example, if we have parameters a and b, defined
         as a = [1, 2, 3] and b = [5, 6], we will need to run the following
         simulations
             a = 1, b = 5
@@ -79,6 +105,9 @@ class Config:
             run = 3, a = 0, b = 1
             run = 4, a = 1, b = 0
             run = 5, a = 2, b = 1
+        Indexes are not stored for every run. The run number is treated as a
+        mixed-radix number, with one digit per parameter, and decoded on demand
+        by get_param_index(), so memory does not grow with the number of runs
         """
         # compute the total number of runs. given that we are performing a
         # cartesian product, we simply multiply the sizes of all parameters
@@ -88,20 +117,28 @@ class Config:
             if type(self.cfg[self.section][p]) == list:
                 count = count * len(self.cfg[self.section][p])
 
-        # list of run ids, going from 0 to count - 1
-        runs = range(count)
-        # map from run number to index of a parameter inside its array
+        # map from parameter to (weight of its digit, number of values)
         par_map = {}
         prev_size = 1
         for p in self.cfg[self.section].keys():
             if type(self.cfg[self.section][p]) == list:
                 own_size = len(self.cfg[self.section][p])
-                par_map[p] = map((lambda x: x / prev_size % own_size), runs)
+                par_map[p] = (prev_size, own_size)
                 prev_size = prev_size * own_size
 
         self.runs_count = count
         self.par_map = par_map
 
+    def get_param_index(self, param, run_number):
+        """
+        Returns the index of the value of a parameter for a given run number
+        :param param: the parameter's name. Must be a list of values
+        :param run_number: the run number
+        :returns: the index of the value inside the list of values
+        """
+        prev_size, own_size = self.par_map[param]
+        return run_number // prev_size % own_size
+
     def get_runs_count(self):
         """
         Returns the number of runs in the simulation
@@ -117,46 +154,146 @@ class Config:
         self.run_number = run_number
         self.compute_output_file_name()
 
-    def remove_comments(self, json_file):
+    def load(self, config_file):
+        """
+        Loads the configuration from a json file, or from its cache if the file
+        did not change since it was cached
+        :param config_file: json file name
+        :returns: the parsed configuration
+        """
+        content = open(config_file).read()
+        digest = hashlib.sha1(content).hexdigest()
+        directory, name = os.path.split(config_file)
+        cache_file = os.path.join(directory, "." + name + Config.CACHE_SUFFIX)
+        try:
+            with open(cache_file, "rb") as f:
+                cached_digest, cfg = pickle.load(f)
+            if cached_digest == digest:
+                return cfg
+        except Exception:
+            # missing or unreadable cache: parse the file
+            pass
+
+        # load configuration from json
+        json_content = self.remove_comments(content)
+        try:
+            cfg = json.loads(json_content)
+        except Exception as e:
+            print("Unable to parse " + config_file)
+            print(e.message)
+            sys.exit(1)
+
+        try:
+            with open(cache_file, "wb") as f:
+                pickle.dump((digest, cfg), f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
+        return cfg
+
+    def remove_comments(self, content):
         """
-        Removes the comments from a json file (non standard)
-        :param json_file: json file name
+        Removes the comments from the content of a json file (non standard)
+        :param content: the content of the json file
         :returns: the content of the file without comments
         """
-        # regular expression to remove comments from json file
-        cr = re.compile('(^)?[^\S\n]*/(?:\*(.*?)\*/[^\S\n]*|/[^\n]*)($)?',
-                        re.DOTALL | re.MULTILINE)
-        content = ''.join(open(json_file).readlines())
-        # looking for comments
-        match = cr.search(content)
-        while match:
-            # single line comment
-            content = content[:match.start()] + content[match.end():]
-            match = cr.search(content)
-        return content
+        return Config.COMMENTS.sub('', content)
 
-    def get_param(self, param):
+    def get_param(self, param, default=None):
         """
         Returns the value of a parameter from the configuration file. Throws an
-        error if the parameter is not found
+        error if the parameter is not found and no default value is given
         :param param: the parameter's name
+        :param default: value returned when the parameter is not configured
         """
         # first check that param exists
         if param in self.cfg[self.section]:
             # if the parameter is in par_map, then it is a vector of values. In
             # such a case, we take a value depending on the run number
             if param in self.par_map:
-                index = self.par_map[param][self.run_number]
+                index = self.get_param_index(param, self.run_number)
                 return self.cfg[self.section][param][index]
             # if instead the parameter is not in par_map, then it's a single
             # value. Just return it
             else:
                 return self.cfg[self.section][param]
+        elif default is not None:
+            return default
         else:
             print("Error: parameter %s not found in section %s",
                   (param, self.section))
             sys.exit(1)
 
+    def get_run_params(self):
+        """
+        Returns the value of every parameter for the current run number
+        :returns: a map from parameter name to value
+        """
+        params = {}
+        for param in self.cfg[self.section].keys():
+            params[param] = self.get_param(param)
+        return params
+
+    @staticmethod
+    def hash_file(path):
+        """
+        Computes the digest of the content of a file
+        :param path: path of the file
+        :returns: the SHA-1 digest of the file, in hexadecimal
+        """
+        digest = hashlib.sha1()
+        try:
+            with open(path, "rb") as f:
+                block = f.read(Config.HASH_BLOCK_SIZE)
+                while block:
+                    digest.update(block)
+                    block = f.read(Config.HASH_BLOCK_SIZE)
+        except IOError as e:
+            print("Cannot read {}: {}".format(path, e))
+            sys.exit(1)
+        return digest.hexdigest()
+
+    def get_run_key(self):
+        """
+        Returns a key identifying the current run by the values of its
+        parameters rather than by its run number, which changes when values
+        are added to the sweep. The parameters in RUN_KEY_EXCLUDED are not
+        part of the key, and those in RUN_KEY_FILES are replaced by the
+        digest of the file they name
+        :returns: the SHA-1 digest of the parameters, in hexadecimal
+        """
+        params = self.get_run_params()
+        for param in Config.RUN_KEY_EXCLUDED:
+            params.pop(param, None)
+        for param in Config.RUN_KEY_FILES:
+            if params.get(param):
+                params[param] = Config.hash_file(params[param])
+        content = json.dumps(params, sort_keys=True)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def compile_output_template(self):
+        """
+        Parses the output file name template into a list of (text, variables)
+        tuples. Plain text has variables set to None, while for variables such
+        as {size.lambda} variables is the list of names ['size', 'lambda']
+        """
+        self.output_template = []
+        if Config.OUTPUT not in self.cfg[self.section]:
+            return
+        template = self.cfg[self.section][Config.OUTPUT]
+        # odd parts are variables, even parts are plain text
+        parts = Config.VARIABLES.split(template)
+        for i, part in enumerate(parts):
+            if i % 2 == 1:
+                # first, split variables (a.b -> 'a', 'b')
+                self.output_template.append((part, part[1:-1].split('.')))
+            elif '{' in part or '}' in part:
+                # a brace outside of a variable is a syntax error like {{ or }}
+                print("Invalid syntax for %s" % template)
+                sys.exit(1)
+            elif part != "":
+                self.output_template.append((part, None))
+
     def compute_output_file_name(self):
         """
         Computes output file name. The user can specify an output file name with
@@ -173,89 +310,43 @@ class Config:
         # identifiers for each simulation run
         if Config.OUTPUT not in self.cfg[self.section]:
             self.output_file = "%s_%d.csv" % (self.section, self.run_number)
+            return
 
         # shorthand to the simulation configuration
         config = self.cfg[self.section]
-        # get output parameter template as configured by the user
-        template = config[Config.OUTPUT]
         # final output file name
-        output = ""
-        # states saying whether we are currently parsing normal text or the name
-        # of a variable
-        OUTVAR = 0
-        INVAR = 1
-        # at the beginning we are outsize of a variable
-        state = OUTVAR
-        # name of the variable we are currently parsing
-        var_name = ""
-        # loop through all characters
-        for i in range(len(template)):
-            if template[i] == '{':
-                # if the character is { then a variable is starting
-                if state == OUTVAR:
-                    # if that is the case, we must be in the OUTVAR state
-                    state = INVAR
-                    var_name = ""
-                else:
-                    # if not, there is a syntax error like {{
-                    print("Invalid syntax for %s" % template)
-                    sys.exit(1)
-            elif template[i] == '}':
-                # if the character is }, then this is the end of a variable name
-                if state == INVAR:
-                    # if syntax is correct, we search for the value of the
-                    # specified parameter
-
-                    # first, split variables (a.b -> 'a', 'b')
-                    variables = var_name.split('.')
-                    # start with the first one
-                    var = variables[0]
-                    if var in self.par_map:
-                        # if the variable is in the par_map, we need to get the
-                        # correct instance depending on the run number
-                        index = self.par_map[var][self.run_number]
-                        obj = config[var][index]
-                        # if the parameter value is an array, instead of taking
-                        # its value we take its index
-                        if isinstance(obj, list):
-                            obj = index
-                    else:
-                        # otherwise we simply take the only value it has
-                        obj = config[var]
-                        # if the parameter value is an array, instead of taking
-                        # its value we take its index
-                        if isinstance(obj, list):
-                            obj = 0
-
-                    # now simply perform "introspection"
-                    for var in variables[1:len(variables)]:
-                        obj = obj[var]
-
-                    # finally get the value
-                    output = output + str(obj)
-                    # and change state
-                    state = OUTVAR
-                else:
-                    # if we are not in the INVAR state, then we have a syntax
-                    # error like }}
-                    print("Invalid syntax for %s" % template)
-                    sys.exit(1)
+        output = []
+        for text, variables in self.output_template:
+            if variables is None:
+                output.append(text)
+                continue
+            # start with the first variable
+            var = variables[0]
+            if var in self.par_map:
+                # if the variable is in the par_map, we need to get the correct
+                # instance depending on the run number
+                index = self.get_param_index(var, self.run_number)
+                obj = config[var][index]
+                # if the parameter value is an array, instead of taking its
+                # value we take its index
+                if isinstance(obj, list):
+                    obj = index
             else:
-                # this is neither a { nor a }. so it's a standard character
-                if state == INVAR:
-                    # if inside a variable, add character to variable name
-                    var_name = var_name + template[i]
-                else:
-                    # otherwise add character to output file name
-                    output = output + template[i]
+                # otherwise we simply take the only value it has
+                obj = config[var]
+                # if the parameter value is an array, instead of taking its
+                # value we take its index
+                if isinstance(obj, list):
+                    obj = 0
 
-        if state == INVAR:
-            # if we are not in the OUTVAR state at the end of the template,
-            # then there is a syntax error
-            print("Invalid syntax for %s" % template)
-            sys.exit(1)
+            # now simply perform "introspection"
+            for var in variables[1:]:
+                obj = obj[var]
+
+            # finally get the value
+            output.append(str(obj))
 
-        self.output_file = output
+        self.output_file = "".join(output)
 
     def get_output_file(self):
         return self.output_file
@@ -269,6 +360,7 @@ class Config:
         """
         params = ""
         config = self.cfg[self.section]
-        for par, val in self.par_map.iteritems():
-            params += "%s: %s " % (par, str(config[par][val[run_number]]))
+        for par in self.par_map.iterkeys():
+            index = self.get_param_index(par, run_number)
+            params += "%s: %s " % (par, str(config[par][index]))
         return params
@@ -0,0 +1,145 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import math
+import sys
+
+
+class Convergence:
+    """
+    Incremental convergence criterion used to stop a simulation before the
+    halting threshold is reached. Configured with an object in the format
+    {"criterion":NAME,"par1":value[,"par2":value,...]}. Accepted values are:
+    {"criterion" : "unit_price", "bins" : 10, "range" : 1, "width" : 0.05,
+    "min_samples" : 30, "confidence" : 0.95}, converged when the utilization
+    range [0, range] is split in bins and, in every bin, the confidence
+    interval of the mean unit price is narrower than width times the mean
+    {"criterion" : "acceptance", "window" : 1000, "tolerance" : 0.01,
+    "stable" : 3}, converged when the acceptance rate over consecutive windows
+    of allocations changed less than tolerance for stable windows in a row
+    All parameters but the criterion are optional
+    """
+
+    # criterion field
+    CRITERION = "criterion"
+    # unit price curve criterion
+    UNIT_PRICE = "unit_price"
+    # acceptance rate criterion
+    ACCEPTANCE = "acceptance"
+    # number of utilization bins field
+    BINS = "bins"
+    # maximum utilization covered by the bins field
+    RANGE = "range"
+    # relative width of the confidence intervals field
+    WIDTH = "width"
+    # minimum number of samples per bin field
+    MIN_SAMPLES = "min_samples"
+    # confidence level field
+    CONFIDENCE = "confidence"
+    # number of allocations per window field
+    WINDOW = "window"
+    # maximum change of the acceptance rate field
+    TOLERANCE = "tolerance"
+    # number of stable windows field
+    STABLE = "stable"
+
+    # allocations between two evaluations of the unit price criterion
+    CHECK_INTERVAL = 100
+    # two-sided normal quantiles of the supported confidence levels
+    QUANTILES = {0.9: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+    def __init__(self, config):
+        """
+        Constructor
+        :param config: the criterion configuration
+        """
+        self.criterion = config.get(Convergence.CRITERION)
+        if self.criterion == Convergence.UNIT_PRICE:
+            self.bins = int(config.get(Convergence.BINS, 10))
+            self.range = float(config.get(Convergence.RANGE, 1))
+            self.width = float(config.get(Convergence.WIDTH, 0.05))
+            self.min_samples = int(config.get(Convergence.MIN_SAMPLES, 30))
+            confidence = config.get(Convergence.CONFIDENCE, 0.95)
+            if confidence not in Convergence.QUANTILES:
+                print("Convergence error: unsupported confidence %s" %
+                      confidence)
+                sys.exit(1)
+            self.quantile = Convergence.QUANTILES[confidence]
+            # per bin count, mean and sum of squared differences (Welford)
+            self.count = [0] * self.bins
+            self.mean = [0.0] * self.bins
+            self.m2 = [0.0] * self.bins
+            self.updates = 0
+        elif self.criterion == Convergence.ACCEPTANCE:
+            self.window = int(config.get(Convergence.WINDOW, 1000))
+            self.tolerance = float(config.get(Convergence.TOLERANCE, 0.01))
+            self.stable = int(config.get(Convergence.STABLE, 3))
+            self.accepted = 0
+            self.allocations = 0
+            self.rate = None
+            self.stable_windows = 0
+        else:
+            print("Convergence error: unknown criterion %s" % self.criterion)
+            sys.exit(1)
+        self.converged = False
+
+    def update(self, allocation):
+        """
+        Updates the criterion with the result of an allocation request
+        :param allocation: the allocation or None if the request was rejected
+        """
+        if self.criterion == Convergence.UNIT_PRICE:
+            if allocation is None:
+                return
+            utilization = float(allocation.utilization)
+            if utilization > self.range:
+                return
+            b = min(int(utilization / self.range * self.bins), self.bins - 1)
+            value = float(allocation.unit_price)
+            self.count[b] += 1
+            delta = value - self.mean[b]
+            self.mean[b] += delta / self.count[b]
+            self.m2[b] += delta * (value - self.mean[b])
+            self.updates += 1
+            if self.updates % Convergence.CHECK_INTERVAL == 0:
+                self.converged = self.check_unit_price()
+        else:
+            self.allocations += 1
+            if allocation is not None:
+                self.accepted += 1
+            if self.allocations == self.window:
+                rate = self.accepted / float(self.allocations)
+                if self.rate is not None and \
+                        abs(rate - self.rate) <= self.tolerance:
+                    self.stable_windows += 1
+                else:
+                    self.stable_windows = 0
+                self.rate = rate
+                self.accepted = 0
+                self.allocations = 0
+                self.converged = self.stable_windows >= self.stable
+
+    def check_unit_price(self):
+        """
+        Checks whether the unit price curve converged
+        """
+        for b in range(self.bins):
+            n = self.count[b]
+            if n < self.min_samples:
+                return False
+            half_width = self.quantile * math.sqrt(self.m2[b] / (n - 1) / n)
+            if 2 * half_width > self.width * abs(self.mean[b]):
+                return False
+        return True
@@ -14,8 +14,12 @@
 # Copyright (C) 2016 Michele Segata <segata@ccs-labs.org>
 # Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
 
+import hashlib
+import math
+import numpy as np
 import scipy.stats as stats
 import sys
+from collections import OrderedDict
 
 
 class Distribution:
@@ -48,10 +52,16 @@ class Distribution:
     EXPONENTIAL = "exp"
     # pareto random variable
     PARETO = "pareto"
+    # number of values drawn at once when the buffer of samples runs out
+    BUFFER_SIZE = 4096
+    # maximum number of probabilities remembered by get_probability()
+    CACHE_SIZE = 1024
 
-    def __init__(self, config):
+    def __init__(self, config, seed=None):
         """
         Instantiates the distribution
+        :param seed: seed of the PRNG of this distribution, e.g., derived from
+        the run seed with derive_seed(). None seeds it from the OS
         :param config: an object used for configuring the distribution in the
         format {"distribution":NAME,"par1":value[,"par2":value,...]}.
         Accepted values so far are:
@@ -98,17 +108,69 @@ class Distribution:
             print("Error while reading distribution parameters")
             print(e.message)
             sys.exit(1)
+        # PRNG used only by this distribution, so that the values drawn do not
+        # depend on other distributions or threads
+        self.random = np.random.RandomState(seed)
+        # values already drawn and not yet returned by get_value()
+        self.buffer = []
+        self.position = 0
+        # recently computed probabilities, oldest first
+        self.cache = OrderedDict()
 
     def get_value(self):
-        return self.d.get_value()
+        if self.position == len(self.buffer):
+            self.buffer = self.d.get_values(Distribution.BUFFER_SIZE,
+                                            self.random).tolist()
+            self.position = 0
+        value = self.buffer[self.position]
+        self.position += 1
+        return value
+
+    def get_values(self, n):
+        """
+        Returns n values at once, starting with the ones left in the buffer
+        :param n: number of values
+        :returns: a numpy array of values
+        """
+        buffered = self.buffer[self.position:self.position + n]
+        self.position += len(buffered)
+        if len(buffered) == n:
+            return np.array(buffered)
+        return np.concatenate((buffered, self.d.get_values(n - len(buffered),
+                                                           self.random)))
 
     def get_probability(self, a, b):
         """ Get the probability of assuming values in the given interval"""
-        return self.d.get_probability(a, b)
+        key = (a, b)
+        probability = self.cache.get(key)
+        if probability is None:
+            probability = self.d.get_probability(a, b)
+            if len(self.cache) >= Distribution.CACHE_SIZE:
+                # evict the oldest entry
+                self.cache.popitem(last=False)
+            self.cache[key] = probability
+        return probability
 
     def get_mean(self):
         return self.d.get_mean()
 
+    def get_state(self):
+        """
+        Returns the state to store in a checkpoint
+        :returns: a tuple (values drawn but not returned yet, PRNG state)
+        """
+        return self.buffer[self.position:], self.random.get_state()
+
+    def set_state(self, state):
+        """
+        Restores the state stored in a checkpoint
+        :param state: the state returned by get_state()
+        """
+        buffer, random_state = state
+        self.buffer = list(buffer)
+        self.position = 0
+        self.random.set_state(random_state)
+
 class Const:
     """
     Constant random variable
@@ -121,8 +183,8 @@ class Const:
         """
         self.value = value
 
-    def get_value(self):
-        return self.value
+    def get_values(self, n, random):
+        return np.full(n, self.value)
 
     def get_probability(self, a, b):
         if a <= self.value and self.value <= b:
@@ -149,19 +211,25 @@ class Uniform:
         self.max = max
         self.integer = integer
 
-    def get_value(self):
-        value =  stats.uniform.rvs(self.min, self.max - self.min)
+    def get_values(self, n, random):
+        values = random.uniform(self.min, self.max, n)
         if self.integer:
-            return round(value)
+            return round_half_away(values)
         else:
-            return value
+            return values
 
     def get_mean(self):
         return stats.uniform.mean(self.min, self.max - self.min)
 
     def get_probability(self, a, b):
-        return stats.uniform.cdf(b, self.min, self.max - self.min) - \
-            stats.uniform.cdf(a, self.min, self.max - self.min)
+        return self.cdf(b) - self.cdf(a)
+
+    def cdf(self, x):
+        if x <= self.min:
+            return 0.0
+        if x >= self.max:
+            return 1.0
+        return float(x - self.min) / (self.max - self.min)
 
 class Exp:
     """
@@ -175,12 +243,16 @@ class Exp:
         """
         self.mean = mean
 
-    def get_value(self):
-        return stats.expon.rvs(0, self.mean)
+    def get_values(self, n, random):
+        return random.exponential(self.mean, n)
 
     def get_probability(self, a, b):
-        return stats.expon.cdf(b, 0, self.mean) - \
-            stats.expon.cdf(a, 0, self.mean)
+        return self.cdf(b) - self.cdf(a)
+
+    def cdf(self, x):
+        if x <= 0:
+            return 0.0
+        return 1 - math.exp(-float(x) / self.mean)
 
     def get_mean(self):
         return self.mean
@@ -201,16 +273,45 @@ class Pareto:
         self.mode = mode
         self.integer = integer
 
-    def get_value(self):
-        value = stats.pareto.rvs(self.shape, self.mode)
+    def get_values(self, n, random):
+        # same as stats.pareto.rvs(self.shape, self.mode): numpy draws from
+        # the pareto distribution shifted to start at 0 instead of 1
+        values = random.pareto(self.shape, n) + 1 + self.mode
         if self.integer:
-            return round(value)
+            return round_half_away(values)
         else:
-            return value
+            return values
 
     def get_probability(self, a, b):
-        return stats.pareto.cdf(b, self.shape, self.mode) - \
-            stats.pareto.cdf(a, self.shape, self.mode)
+        return self.cdf(b) - self.cdf(a)
+
+    def cdf(self, x):
+        # same as stats.pareto.cdf(x, self.shape, self.mode), i.e., the
+        # distribution is shifted by mode and starts at mode + 1
+        x = float(x) - self.mode
+        if x <= 1:
+            return 0.0
+        return 1 - x ** -self.shape
 
     def get_mean(self):
         return stats.pareto.mean(self.shape, self.mode)
+
+def round_half_away(values):
+    """
+    Rounds an array of values like the builtin round(), i.e., halfway values
+    are rounded away from zero instead of to the nearest even number
+    """
+    return np.sign(values) * np.floor(np.abs(values) + 0.5)
+
+def derive_seed(seed, stream):
+    """
+    Derives the seed of an independent stream of random numbers from a seed,
+    so that every consumer of random numbers of a run gets its own PRNG
+    :param seed: the seed, e.g., the one of the run
+    :param stream: name identifying the stream, e.g., "size"
+    :returns: a 32 bit seed, or None if seed is None
+    """
+    if seed is None:
+        return None
+    digest = hashlib.sha256(("%s/%s" % (seed, stream)).encode()).hexdigest()
+    return int(digest[:8], 16)
@@ -0,0 +1,149 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import json
+import urllib3
+from urllib3.exceptions import HTTPError
+from local_backend import DeploymentRequest, Allocation, Node
+
+
+class HttpBackend:
+    """
+    Cluster backend that calls the pricing API directly over a pool of
+    persistent HTTP connections, skipping the per-call overhead of the
+    generated swagger client. Only the calls used by the simulator are
+    implemented. Connections are thread safe and shared by all the requests in
+    flight, so the pool should be at least as large as the window
+    """
+
+    # API endpoint
+    ENDPOINT = "endpoint"
+    # number of requests in flight at the same time
+    WINDOW = "window"
+    # number of parallel deletions at teardown
+    TEARDOWN_WORKERS = "teardown_workers"
+    # number of persistent connections to the API
+    POOL_SIZE = "pool_size"
+    # timeout in seconds for establishing a connection
+    CONNECT_TIMEOUT = "connect_timeout"
+    # timeout in seconds for receiving a response
+    READ_TIMEOUT = "read_timeout"
+
+    DEPLOYMENT_PATH = "/deployments/%s"
+    NODES_PATH = "/nodes"
+    HEADERS = {'Content-Type': 'application/json',
+               'Accept': 'application/json'}
+
+    def __init__(self, config):
+        """
+        Constructor
+        :param config: the simulation configuration
+        """
+        self.endpoint = config.get_param(HttpBackend.ENDPOINT).rstrip('/')
+        # one connection per request in flight or parallel deletion
+        window = int(config.get_param(HttpBackend.WINDOW, 1))
+        workers = int(config.get_param(HttpBackend.TEARDOWN_WORKERS, 8))
+        pool_size = int(config.get_param(HttpBackend.POOL_SIZE,
+                                         max(window, workers)))
+        timeout = urllib3.Timeout(
+            connect=float(config.get_param(HttpBackend.CONNECT_TIMEOUT, 5)),
+            read=float(config.get_param(HttpBackend.READ_TIMEOUT, 30)))
+        # block instead of opening extra connections that would be discarded
+        self.http = urllib3.PoolManager(maxsize=pool_size, block=True,
+                                        timeout=timeout, retries=False)
+
+    def create_request(self, application, offer, resource, amount):
+        """
+        Builds a deployment request for the given application
+        :param application: the application to deploy
+        :param offer: the offer for the whole deployment
+        :param resource: the requested resource
+        :param amount: amount of resource to request (not scaled)
+        :returns: the deployment request
+        """
+        return DeploymentRequest(application, str(offer),
+                                 [{'name': resource, 'amount': str(amount)}])
+
+    def put_deployment(self, name, request):
+        """
+        Requests a deployment
+        :param name: the deployment name
+        :param request: the deployment request
+        :returns: the allocation or None if the request was rejected or could
+        not be sent
+        """
+        body = json.dumps({'application': request.application,
+                           'offer': request.offer,
+                           'resources': request.resources})
+        try:
+            response = self.http.request('PUT', self.endpoint +
+                                         HttpBackend.DEPLOYMENT_PATH % name,
+                                         body=body,
+                                         headers=HttpBackend.HEADERS)
+        except HTTPError:
+            # timeouts, refused connections and broken responses
+            return None
+        if response.status // 100 != 2:
+            return None
+        data = json.loads(response.data.decode('utf-8'))
+        return Allocation(data['node'], data['utilization'], data['offer'],
+                          data['price'], data['unit_price'],
+                          data['resources'])
+
+    def delete_deployment(self, name):
+        """
+        Deletes a deployment
+        :param name: the deployment name
+        :returns: whether the deployment has been deleted
+        """
+        try:
+            response = self.http.request('DELETE', self.endpoint +
+                                         HttpBackend.DEPLOYMENT_PATH % name,
+                                         headers=HttpBackend.HEADERS)
+        except HTTPError:
+            return False
+        return response.status // 100 == 2
+
+    def get_nodes(self):
+        """
+        Returns the nodes of the cluster
+        :raises IOError: if the nodes cannot be read
+        """
+        url = self.endpoint + HttpBackend.NODES_PATH
+        try:
+            response = self.http.request('GET', url,
+                                         headers=HttpBackend.HEADERS)
+        except HTTPError as e:
+            raise IOError("Cannot read the nodes from %s: %s" % (url, e))
+        if response.status // 100 != 2:
+            raise IOError("Cannot read the nodes from %s: HTTP status %d" %
+                          (url, response.status))
+        data = json.loads(response.data.decode('utf-8'))
+        return [Node(node['name'], node['resources'])
+                for node in data['nodes']]
+
+    def get_state(self):
+        """
+        Returns the state to store in a checkpoint. The deployments live on
+        the cluster, so there is nothing to store
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores the state stored in a checkpoint
+        :param state: the state returned by get_state()
+        """
+        pass
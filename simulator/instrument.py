@@ -0,0 +1,199 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import json
+import threading
+import time
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, each split in SUB_BUCKETS
+    linear sub-buckets (as in HDR histograms), so that every recorded value is
+    known within 1/SUB_BUCKETS of its magnitude. Values are recorded in
+    microseconds
+    """
+
+    # number of linear sub-buckets per power of two. must be a power of two
+    SUB_BUCKETS = 16
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Records a value
+        :param seconds: the value in seconds
+        """
+        us = int(seconds * 1e6)
+        if us < Histogram.SUB_BUCKETS:
+            # values smaller than SUB_BUCKETS are exact
+            bucket = us
+        else:
+            # keep the log2(SUB_BUCKETS) + 1 most significant binary digits,
+            # i.e., the leading 1 and the index of the linear sub-bucket
+            shift = us.bit_length() - Histogram.SUB_BUCKETS.bit_length()
+            bucket = (us >> shift) << shift
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += us
+            if self.min is None or us < self.min:
+                self.min = us
+            if self.max is None or us > self.max:
+                self.max = us
+
+    def get_percentile(self, percentile):
+        """
+        Returns the lower bound of the bucket containing a percentile
+        :param percentile: the percentile, between 0 and 100
+        :returns: the value in microseconds
+        """
+        if self.count == 0:
+            return None
+        threshold = self.count * percentile / 100.0
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= threshold:
+                return bucket
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns a machine readable summary of the histogram
+        """
+        return {"count": self.count,
+                "mean_us": self.total / float(self.count) if self.count else None,
+                "min_us": self.min,
+                "max_us": self.max,
+                "p50_us": self.get_percentile(50),
+                "p90_us": self.get_percentile(90),
+                "p99_us": self.get_percentile(99),
+                "p999_us": self.get_percentile(99.9),
+                "buckets_us": dict([(str(b), c) for b, c in
+                                    sorted(self.counts.items())])}
+
+
+class Instrumentation:
+    """
+    Measures the time spent in each phase of a simulation. Phases are measured
+    by replacing the methods of the simulation components with timed versions,
+    so a simulation that is not instrumented runs unmodified code and pays no
+    overhead. A snapshot of the measurements can be appended to a JSON lines
+    file every interval seconds while the simulation runs, and a final report
+    written at the end
+    """
+
+    def __init__(self, snapshot_file=None, interval=0):
+        """
+        Constructor
+        :param snapshot_file: file periodic snapshots are appended to
+        :param interval: seconds between two snapshots. 0 disables snapshots
+        """
+        self.histograms = {}
+        self.snapshot_file = snapshot_file
+        # reporters with an infinite interval are never called periodically
+        self.interval = interval if interval > 0 else float('inf')
+        self.start_time = time.time()
+
+    def attach(self, sim):
+        """
+        Instruments the phases of an initialized simulation
+        :param sim: the simulation
+        """
+        cluster = sim.cluster
+        self.wrap(sim, "print_percentage", "redraw")
+        self.wrap(cluster, "request_allocation", "allocation")
+        self.wrap(cluster, "get_allocation_probability", "probability")
+        self.wrap(cluster, "reconcile", "reconcile")
+        self.wrap(cluster.size, "get_value", "sample_size")
+        self.wrap(cluster.offer, "get_value", "sample_offer")
+        self.wrap(cluster.backend, "put_deployment", "put_deployment")
+        self.wrap(cluster.backend, "delete_deployment", "delete_deployment")
+        self.wrap(cluster.backend, "get_nodes", "get_nodes")
+        self.wrap(sim.logger, "log_allocation", "log")
+        self.wrap(sim.logger, "log_failure", "log")
+
+    def wrap(self, obj, method, phase):
+        """
+        Replaces a method of an object with a version recording its duration
+        :param obj: the object
+        :param method: the name of the method
+        :param phase: the name of the phase the method belongs to
+        """
+        histogram = self.histograms.setdefault(phase, Histogram())
+        function = getattr(obj, method)
+        clock = time.time
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.record(clock() - start)
+
+        setattr(obj, method, timed)
+
+    def start(self):
+        """
+        Marks the beginning of a run
+        """
+        self.start_time = time.time()
+
+    def get_report(self, sim=None):
+        """
+        Returns a machine readable report of the measurements
+        :param sim: optional simulation whose counters are included
+        """
+        counters = {}
+        if sim is not None:
+            counters["deployments"] = sim.deployments
+            counters["failed"] = sim.failed
+            counters["reconciliations"] = sim.cluster.reconciliations
+            counters["deleted"] = sim.cluster.deleted
+            counters["teardown_failures"] = len(sim.cluster.teardown_failures)
+        return {"elapsed": time.time() - self.start_time,
+                "counters": counters,
+                "phases": dict([(p, h.to_dict()) for p, h in
+                                self.histograms.items()])}
+
+    def report(self, sim, done=False):
+        """
+        Appends a snapshot of the measurements to the snapshot file
+        :param sim: the running simulation
+        :param done: whether the run is completed
+        """
+        if self.snapshot_file is None:
+            return
+        report = self.get_report(sim)
+        report["run"] = sim.run_number
+        report["state"] = "done" if done else "running"
+        with open(self.snapshot_file, "a") as f:
+            f.write(json.dumps(report, sort_keys=True) + "\n")
+
+    def dump(self, report_file, sim=None):
+        """
+        Writes the final report
+        :param report_file: the report file name
+        :param sim: optional simulation whose counters are included
+        """
+        with open(report_file, "w") as f:
+            json.dump(self.get_report(sim), f, indent=2, sort_keys=True)
@@ -0,0 +1,187 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import heapq
+import math
+
+
+class DeploymentRequest:
+    """
+    Deployment request, mirroring the fields of the API request model
+    """
+
+    def __init__(self, application, offer, resources):
+        self.application = application
+        self.offer = offer
+        self.resources = resources
+
+
+class Allocation:
+    """
+    Allocation returned for an accepted deployment, mirroring the fields of the
+    API response model
+    """
+
+    def __init__(self, node, utilization, offer, price, unit_price, resources):
+        self.node = node
+        self.utilization = utilization
+        self.offer = offer
+        self.price = price
+        self.unit_price = unit_price
+        self.resources = resources
+
+
+class Node:
+    """
+    Cluster node, mirroring the fields of the API node model
+    """
+
+    def __init__(self, name, resources):
+        self.name = name
+        self.resources = resources
+
+
+class LocalBackend:
+    """
+    Cluster backend that models nodes, placement and pricing in memory, without
+    any API call. All nodes have the same capacity and a deployment is placed
+    on the least utilized node, which is also the cheapest one. The unit price
+    of a node grows exponentially with its utilization:
+        unit_price = base_price * exp(scarcity * utilization)
+    and a deployment is accepted only if its offer covers the price on that
+    node
+    """
+
+    # number of nodes in the cluster
+    NODES = "nodes"
+    # allocatable amount of resource on each node (not scaled)
+    NODE_CAPACITY = "node_capacity"
+    # unit price of an empty node
+    BASE_PRICE = "base_price"
+    # growth rate of the unit price with the node utilization
+    SCARCITY = "scarcity"
+    # the requested resource
+    RESOURCE = "resource"
+    # scale for the resource amounts
+    RESOURCE_SCALE = "resource_scale"
+
+    def __init__(self, config):
+        """
+        Constructor
+        :param config: the simulation configuration
+        """
+        self.resource = config.get_param(LocalBackend.RESOURCE)
+        self.resource_scale = float(config.get_param(LocalBackend.RESOURCE_SCALE))
+        self.capacity = float(config.get_param(LocalBackend.NODE_CAPACITY))
+        self.base_price = float(config.get_param(LocalBackend.BASE_PRICE, 1.0))
+        self.scarcity = float(config.get_param(LocalBackend.SCARCITY, 1.0))
+        nodes = int(config.get_param(LocalBackend.NODES))
+
+        self.nodes = []
+        for i in range(nodes):
+            self.nodes.append(Node("node-%d" % i, {
+                self.resource: {'allocatable': self.capacity,
+                                'free': self.capacity}}))
+        # free resources of each node, indexed like self.nodes
+        self.free = [self.capacity] * nodes
+        # max-heap of (-free, node index). Entries whose free value differs
+        # from self.free are stale and skipped when they reach the top
+        self.heap = [(-self.capacity, i) for i in range(nodes)]
+        # deployment name -> (node index, allocated amount)
+        self.deployments = {}
+
+    def create_request(self, application, offer, resource, amount):
+        """
+        Builds a deployment request for the given application
+        :param application: the application to deploy
+        :param offer: the offer for the whole deployment
+        :param resource: the requested resource
+        :param amount: amount of resource to request (not scaled)
+        :returns: the deployment request
+        """
+        return DeploymentRequest(application, offer,
+                                 [{'name': resource, 'amount': amount}])
+
+    def put_deployment(self, name, request):
+        """
+        Places a deployment on the least utilized node
+        :param name: the deployment name
+        :param request: the deployment request
+        :returns: the allocation or None if the request was rejected
+        """
+        amount = float(request.resources[0]['amount'])
+        offer = float(request.offer)
+
+        # get the least utilized node, discarding stale heap entries
+        heap = self.heap
+        while -heap[0][0] != self.free[heap[0][1]]:
+            heapq.heappop(heap)
+        free, i = heap[0]
+        free = -free
+
+        # if the deployment does not fit here it does not fit anywhere
+        if amount > free:
+            return None
+
+        free -= amount
+        utilization = 1 - free / self.capacity
+        unit_price = self.base_price * math.exp(self.scarcity * utilization)
+        price = unit_price * amount / self.resource_scale
+        if price > offer:
+            return None
+
+        heapq.heapreplace(heap, (-free, i))
+        self.free[i] = free
+        node = self.nodes[i]
+        node.resources[self.resource]['free'] = free
+        self.deployments[name] = (i, amount)
+        return Allocation(node.name, utilization, offer, price, unit_price,
+                          {self.resource: {'used': amount}})
+
+    def delete_deployment(self, name):
+        """
+        Deletes a deployment, releasing its resources
+        :param name: the deployment name
+        :returns: whether the deployment has been deleted
+        """
+        if name not in self.deployments:
+            return False
+        i, amount = self.deployments.pop(name)
+        self.free[i] += amount
+        self.nodes[i].resources[self.resource]['free'] = self.free[i]
+        heapq.heappush(self.heap, (-self.free[i], i))
+        return True
+
+    def get_nodes(self):
+        """
+        Returns the nodes of the cluster
+        """
+        return self.nodes
+
+    def get_state(self):
+        """
+        Returns the state to store in a checkpoint
+        :returns: a tuple (free resources, heap, deployments)
+        """
+        return list(self.free), list(self.heap), dict(self.deployments)
+
+    def set_state(self, state):
+        """
+        Restores the state stored in a checkpoint
+        :param state: the state returned by get_state()
+        """
+        self.free, self.heap, self.deployments = state
+        for i, node in enumerate(self.nodes):
+            node.resources[self.resource]['free'] = self.free[i]
@@ -14,6 +14,13 @@
 # Copyright (C) 2016 Michele Segata <segata@ccs-labs.org>
 # Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
 
+import json
+import os
+import sys
+import time
+import numpy as np
+
+
 class Log:
     """
     Defines data logging utilities
@@ -22,14 +29,25 @@ class Log:
     TYPE_SUCCESS = "1"
     TYPE_FAILURE = "0"
 
-    def __init__(self, output_file):
+    # columns of the output file
+    COLUMNS = ["accepted", "size", "node", "utilization", "offer", "price",
+               "unit_price"]
+
+    def __init__(self, output_file, offset=None):
         """
         Constructor.
         :param output_file: output file name. will be overwritten if already
         existing
+        :param offset: if given, the existing file is kept up to this offset,
+        as returned by get_offset(), and new records are appended from there
         """
-        self.log_file = open(output_file, "w")
-        self.log_file.write("accepted,size,node,utilization,offer,price,unit_price\n")
+        if offset is None:
+            self.log_file = open(output_file, "w")
+            self.log_file.write(",".join(Log.COLUMNS) + "\n")
+        else:
+            self.log_file = open(output_file, "r+")
+            self.log_file.seek(offset)
+            self.log_file.truncate()
 
     def log_allocation(self, allocation, resource):
         """
@@ -52,3 +70,349 @@ class Log:
         self.log_file.write(self.TYPE_FAILURE + ",%f,,,%f,,\n" %
                             (float(request.resources[0]['amount']),
                              float(request.offer)))
+
+    def get_offset(self):
+        """
+        Flushes the output file
+        :returns: the offset at which the next record will be written
+        """
+        self.log_file.flush()
+        return self.log_file.tell()
+
+    @staticmethod
+    def count_records(output_file, offset):
+        """
+        Counts the records of an output file written after an offset
+        :param output_file: the output file name
+        :param offset: the offset, as returned by get_offset()
+        """
+        count = 0
+        with open(output_file, "rb") as f:
+            f.seek(offset)
+            for block in iter(lambda: f.read(1 << 20), b""):
+                count += block.count(b"\n")
+        return count
+
+    def close(self):
+        """
+        Flushes and closes the output file
+        """
+        self.log_file.close()
+
+
+class MemoryLog:
+    """
+    Data logger keeping all the records in memory
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.columns = dict([(c, []) for c in Log.COLUMNS])
+
+    def log_allocation(self, allocation, resource):
+        """
+        Logs the result of an allocation request
+        :param allocation: resource allocation
+        """
+        self.columns["accepted"].append(1)
+        self.columns["size"].append(float(allocation.resources[resource]['used']))
+        self.columns["node"].append(allocation.node)
+        self.columns["utilization"].append(float(allocation.utilization))
+        self.columns["offer"].append(float(allocation.offer))
+        self.columns["price"].append(float(allocation.price))
+        self.columns["unit_price"].append(float(allocation.unit_price))
+
+    def log_failure(self, request):
+        """
+        Logs the result of an allocation request
+        :param allocation: resource allocation
+        """
+        nan = float('nan')
+        self.columns["accepted"].append(0)
+        self.columns["size"].append(float(request.resources[0]['amount']))
+        self.columns["node"].append(None)
+        self.columns["utilization"].append(nan)
+        self.columns["offer"].append(float(request.offer))
+        self.columns["price"].append(nan)
+        self.columns["unit_price"].append(nan)
+
+    def close(self):
+        pass
+
+    def get_records(self):
+        """
+        Returns the logged records
+        :returns: a map from column name to numpy array
+        """
+        records = {}
+        for c in Log.COLUMNS:
+            if c == "node":
+                records[c] = np.array(self.columns[c], dtype=object)
+            elif c == "accepted":
+                records[c] = np.array(self.columns[c], dtype=np.int8)
+            else:
+                records[c] = np.array(self.columns[c], dtype=float)
+        return records
+
+
+class ParquetLog:
+    """
+    Data logger buffering records in typed arrays and writing them in batches
+    as row groups of a Parquet file. The simulation parameters are stored in
+    the file metadata under the "params" key, as JSON. Requires pyarrow
+    """
+
+    # extension of the output files written by this logger
+    EXTENSION = ".parquet"
+    # number of records buffered before being written
+    BATCH_SIZE = 65536
+
+    def __init__(self, output_file, params):
+        """
+        Constructor.
+        :param output_file: output file name. will be overwritten if already
+        existing
+        :param params: the simulation parameters
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([("accepted", pa.int8()),
+                                 ("size", pa.float64()),
+                                 ("node", pa.string()),
+                                 ("utilization", pa.float64()),
+                                 ("offer", pa.float64()),
+                                 ("price", pa.float64()),
+                                 ("unit_price", pa.float64())],
+                                metadata={"params": json.dumps(params)})
+        self.writer = pq.ParquetWriter(output_file, self.schema)
+        self.accepted = np.zeros(ParquetLog.BATCH_SIZE, dtype=np.int8)
+        self.node = [None] * ParquetLog.BATCH_SIZE
+        # size, utilization, offer, price and unit price
+        self.values = np.empty((5, ParquetLog.BATCH_SIZE))
+        self.count = 0
+
+    def log_allocation(self, allocation, resource):
+        """
+        Logs the result of an allocation request
+        :param allocation: resource allocation
+        """
+        i = self.count
+        self.accepted[i] = 1
+        self.node[i] = allocation.node
+        self.values[:, i] = (float(allocation.resources[resource]['used']),
+                             float(allocation.utilization),
+                             float(allocation.offer),
+                             float(allocation.price),
+                             float(allocation.unit_price))
+        self.count += 1
+        if self.count == ParquetLog.BATCH_SIZE:
+            self.flush()
+
+    def log_failure(self, request):
+        """
+        Logs the result of an allocation request
+        :param allocation: resource allocation
+        """
+        i = self.count
+        self.accepted[i] = 0
+        self.node[i] = None
+        self.values[:, i] = (float(request.resources[0]['amount']),
+                             np.nan, float(request.offer), np.nan, np.nan)
+        self.count += 1
+        if self.count == ParquetLog.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the output file
+        """
+        if self.count == 0:
+            return
+        n = self.count
+        pa = self.pa
+        columns = [pa.array(self.accepted[:n]),
+                   pa.array(self.values[0, :n]),
+                   pa.array(self.node[:n], type=pa.string()),
+                   pa.array(self.values[1, :n]),
+                   pa.array(self.values[2, :n]),
+                   pa.array(self.values[3, :n]),
+                   pa.array(self.values[4, :n])]
+        self.writer.write_table(pa.Table.from_arrays(columns,
+                                                     schema=self.schema))
+        self.count = 0
+
+    def close(self):
+        """
+        Writes the remaining records and closes the output file
+        """
+        self.flush()
+        self.writer.close()
+
+
+class RecordLog:
+    """
+    Data logger appending fixed-width records to a file, which can be memory
+    mapped as a numpy structured array with the Log columns while the
+    simulation is still writing it (see read()). The file starts with a
+    header of HEADER_SIZE bytes holding a JSON object with the record type
+    and the simulation parameters, padded with spaces. Node names longer than
+    NODE_SIZE bytes are truncated
+    """
+
+    # extension of the output files written by this logger
+    EXTENSION = ".records"
+    # first bytes of the files written by this logger
+    MAGIC = b"SIMRECORDS1\n"
+    # size of the header, records start right after it
+    HEADER_SIZE = 4096
+    # maximum length of node names
+    NODE_SIZE = 64
+    # type of the records, without padding
+    DTYPE = np.dtype([("accepted", "i1"),
+                      ("size", "<f8"),
+                      ("node", "S%d" % NODE_SIZE),
+                      ("utilization", "<f8"),
+                      ("offer", "<f8"),
+                      ("price", "<f8"),
+                      ("unit_price", "<f8")])
+    # number of records buffered before being appended to the file
+    BATCH_SIZE = 1024
+    # maximum seconds between two appends while records are buffered
+    FLUSH_INTERVAL = 1
+
+    def __init__(self, output_file, params, offset=None):
+        """
+        Constructor.
+        :param output_file: output file name. will be overwritten if already
+        existing
+        :param params: the simulation parameters
+        :param offset: if given, the existing file is kept up to this offset,
+        as returned by get_offset(), and new records are appended from there
+        """
+        if offset is None:
+            self.log_file = open(output_file, "wb")
+            header = json.dumps({"dtype": RecordLog.DTYPE.descr,
+                                 "params": params},
+                                sort_keys=True).encode("utf-8")
+            header = RecordLog.MAGIC + header + b"\n"
+            if len(header) > RecordLog.HEADER_SIZE:
+                print("Log error: the parameters do not fit in the header of "
+                      "%s" % output_file)
+                sys.exit(1)
+            self.log_file.write(header.ljust(RecordLog.HEADER_SIZE, b" "))
+        else:
+            self.log_file = open(output_file, "r+b")
+            self.log_file.seek(offset)
+            self.log_file.truncate()
+        self.records = np.zeros(RecordLog.BATCH_SIZE, dtype=RecordLog.DTYPE)
+        self.count = 0
+        # make the header visible to readers right away
+        self.flush()
+
+    def log_allocation(self, allocation, resource):
+        """
+        Logs the result of an allocation request
+        :param allocation: resource allocation
+        """
+        self.records[self.count] = (1,
+                                    float(allocation.resources[resource]['used']),
+                                    allocation.node.encode("utf-8"),
+                                    float(allocation.utilization),
+                                    float(allocation.offer),
+                                    float(allocation.price),
+                                    float(allocation.unit_price))
+        self.count += 1
+        self.check_flush()
+
+    def log_failure(self, request):
+        """
+        Logs the result of an allocation request
+        :param allocation: resource allocation
+        """
+        self.records[self.count] = (0, float(request.resources[0]['amount']),
+                                    b"", np.nan, float(request.offer), np.nan,
+                                    np.nan)
+        self.count += 1
+        self.check_flush()
+
+    def check_flush(self):
+        """
+        Appends the buffered records if the buffer is full or if they have
+        been buffered for more than FLUSH_INTERVAL seconds
+        """
+        if self.count == RecordLog.BATCH_SIZE or \
+                time.time() - self.flush_time >= RecordLog.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the buffered records to the output file, making them visible
+        to readers
+        """
+        if self.count > 0:
+            self.log_file.write(self.records[:self.count].tobytes())
+            self.count = 0
+        self.log_file.flush()
+        self.flush_time = time.time()
+
+    def get_offset(self):
+        """
+        Flushes the output file
+        :returns: the offset at which the next record will be written
+        """
+        self.flush()
+        return self.log_file.tell()
+
+    def close(self):
+        """
+        Writes the remaining records and closes the output file
+        """
+        self.flush()
+        self.log_file.close()
+
+    @staticmethod
+    def count_records(output_file, offset):
+        """
+        Counts the complete records of an output file written after an offset
+        :param output_file: the output file name
+        :param offset: the offset, as returned by get_offset()
+        """
+        size = os.path.getsize(output_file) - offset
+        return max(size, 0) // RecordLog.DTYPE.itemsize
+
+    @staticmethod
+    def read_header(output_file):
+        """
+        Reads the header of a file written by this logger
+        :param output_file: the file name
+        :returns: the header, i.e., a map with the record type under "dtype"
+        and the simulation parameters under "params"
+        """
+        with open(output_file, "rb") as f:
+            header = f.read(RecordLog.HEADER_SIZE)
+        if not header.startswith(RecordLog.MAGIC):
+            print("Log error: %s is not a record file" % output_file)
+            sys.exit(1)
+        return json.loads(header[len(RecordLog.MAGIC):].decode("utf-8"))
+
+    @staticmethod
+    def read(output_file):
+        """
+        Maps the records of a file written by this logger, without reading
+        them. The number of records is computed from the size of the file, so
+        only the records written so far are mapped, and a partially written
+        record at the end is ignored
+        :param output_file: the file name
+        :returns: a read-only numpy structured array with the Log columns
+        """
+        header = RecordLog.read_header(output_file)
+        dtype = np.dtype([(str(name), str(t)) for name, t in header["dtype"]])
+        size = os.path.getsize(output_file) - RecordLog.HEADER_SIZE
+        count = max(size, 0) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(output_file, dtype=dtype, mode="r",
+                         offset=RecordLog.HEADER_SIZE, shape=(count,))
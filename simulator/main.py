@@ -16,8 +16,128 @@
 
 
 from optparse import OptionParser
+from multiprocessing import Pool, util
+import itertools
 import sys
+import time
 import sim
+import cluster
+import workload
+from runcache import RunCache
+from progress import StatusReporter
+from instrument import Instrumentation
+
+
+def parse_runs(runs, runs_count):
+    """
+    Parses a range of runs given as FIRST-LAST or as a single run number
+    :param runs: the range of runs
+    :param runs_count: the total number of runs
+    :returns: the list of run numbers in the range
+    """
+    try:
+        bounds = [int(r) for r in runs.split("-")]
+    except ValueError:
+        bounds = []
+    if len(bounds) == 1:
+        bounds = bounds * 2
+    if len(bounds) != 2 or bounds[0] < 0 or bounds[0] > bounds[1] or \
+            bounds[1] >= runs_count:
+        print("Invalid range of runs %s. Available runs are 0-%d" %
+              (runs, runs_count - 1))
+        sys.exit(1)
+    return xrange(bounds[0], bounds[1] + 1)
+
+
+def get_completed_output(config, run_number):
+    """
+    Looks up a run in the index of completed runs
+    :param config: the configuration
+    :param run_number: the run
+    :returns: a tuple (key of the run, output file of the completed run or None
+    if the run has to be simulated)
+    """
+    config.set_run_number(run_number)
+    key = config.get_run_key()
+    if options.force:
+        return key, None
+    return key, run_cache.get(key)
+
+
+def get_pending_runs(config, runs, skipped):
+    """
+    Lazily filters the completed runs out of a sweep
+    :param config: the configuration
+    :param runs: the runs of the sweep
+    :param skipped: one element list, incremented for every skipped run
+    :returns: a generator of the runs to simulate
+    """
+    for run in runs:
+        if get_completed_output(config, run)[1] is None:
+            yield run
+        else:
+            skipped[0] += 1
+
+
+def init_worker():
+    """
+    Initializes a worker process of the sweep, making sure that the teardowns
+    left in the background by its runs complete before the process exits
+    """
+    util.Finalize(None, cluster.Cluster.wait_teardowns, exitpriority=10)
+
+
+def get_reporters(simulator):
+    """
+    Returns the objects reporting the progress of an initialized simulation,
+    instrumenting it if requested
+    :param simulator: the simulation
+    :returns: a list with the status reporter for headless runs and the
+    instrumentation, if enabled
+    """
+    reporters = []
+    if options.headless:
+        reporters.append(StatusReporter(options.status_file, options.interval))
+    if options.instrument:
+        output_file = simulator.config.get_output_file()
+        snapshot_file = None
+        if options.snapshot_interval > 0:
+            snapshot_file = output_file + ".perf.jsonl"
+        instrumentation = Instrumentation(snapshot_file,
+                                          options.snapshot_interval)
+        instrumentation.attach(simulator)
+        reporters.append(instrumentation)
+    return reporters
+
+
+def dump_instrumentation(simulator, reporters):
+    """
+    Writes the instrumentation report of a completed simulation, if enabled
+    :param simulator: the simulation
+    :param reporters: the reporters returned by get_reporters()
+    """
+    for reporter in reporters:
+        if isinstance(reporter, Instrumentation):
+            reporter.dump(simulator.config.get_output_file() + ".perf.json",
+                          simulator)
+
+
+def run_simulation(run_number):
+    """
+    Runs a simulation in a worker process of the sweep
+    :param run_number: the run to simulate
+    :returns: a tuple (run number, total time, deployments, failed, key of the
+    run, output file)
+    """
+    simulator = sim.Sim.Instance()
+    simulator.initialize(run_number, resume=options.resume)
+    reporters = get_reporters(simulator)
+    simulator.run(False, reporters)
+    dump_instrumentation(simulator, reporters)
+    return (run_number, simulator.total_time, simulator.deployments,
+            simulator.failed, simulator.config.get_run_key(),
+            simulator.config.get_output_file())
+
 
 # setup command line parameters
 parser = OptionParser(usage="usage: %prog [options]",
@@ -25,13 +145,61 @@ parser = OptionParser(usage="usage: %prog [options]",
                                   "specified config file under the specified "
                                   "section")
 parser.add_option("-l", "--list", dest="list", default=False,
-                  action="store_true", help="list the available runs and exit")
+                  action="store_true", help="list the available runs (or the "
+                                            "ones selected by --runs) and exit")
 parser.add_option("-L", "--LIST", dest="verbose_list", default=False,
                   action="store_true", help="list the available runs with "
                                             "simulation parameters and exit")
 parser.add_option("-r", "--run", dest="run", default=0, action="store",
                   help="run simulation number RUN [default: %default]",
                   metavar="RUN", type="int")
+parser.add_option("-a", "--all", dest="all", default=False,
+                  action="store_true", help="run all the simulations")
+parser.add_option("-R", "--runs", dest="runs", default="", action="store",
+                  help="run simulations FIRST to LAST (inclusive)",
+                  metavar="FIRST-LAST")
+parser.add_option("-j", "--jobs", dest="jobs", default=1, action="store",
+                  help="number of simulations to run in parallel with --all "
+                       "or --runs [default: %default]", metavar="N",
+                  type="int")
+parser.add_option("-H", "--headless", dest="headless", default=False,
+                  action="store_true", help="do not use the terminal, report "
+                                            "the progress as JSON lines")
+parser.add_option("-S", "--status-file", dest="status_file", default=None,
+                  action="store", help="append headless status lines to FILE "
+                                       "instead of stderr", metavar="FILE")
+parser.add_option("-i", "--interval", dest="interval", default=10,
+                  action="store", help="seconds between headless status "
+                                       "lines [default: %default]",
+                  type="float")
+parser.add_option("-I", "--instrument", dest="instrument", default=False,
+                  action="store_true", help="measure the time spent in each "
+                                            "phase of the simulation and write "
+                                            "a report to OUTPUT.perf.json")
+parser.add_option("--snapshot-interval", dest="snapshot_interval", default=0,
+                  action="store", help="with --instrument, append a snapshot "
+                                       "of the measurements to "
+                                       "OUTPUT.perf.jsonl every SECONDS "
+                                       "[default: never]", metavar="SECONDS",
+                  type="float")
+parser.add_option("-T", "--write-trace", dest="write_trace", default="",
+                  action="store", help="write a trace of requests drawn with "
+                                       "the size, offer and seed of run RUN "
+                                       "to FILE and exit", metavar="FILE")
+parser.add_option("--trace-length", dest="trace_length", default=1000000,
+                  action="store", help="number of requests written with "
+                                       "--write-trace [default: %default]",
+                  metavar="N", type="int")
+parser.add_option("--resume", dest="resume", default=False,
+                  action="store_true", help="continue the selected runs from "
+                                            "their last checkpoint, if any")
+parser.add_option("-f", "--force", dest="force", default=False,
+                  action="store_true", help="simulate the selected runs even "
+                                            "if already completed")
+parser.add_option("--run-index", dest="run_index", default=".runs.jsonl",
+                  action="store", help="index of the completed runs, used to "
+                                       "skip them [default: %default]",
+                  metavar="FILE")
 parser.add_option("-c", "--config", dest="config", default="config.json",
                   action="store",
                   help="simulation config file [default: %default]")
@@ -50,10 +218,15 @@ if options.config == "" or options.section == "":
 simulator = sim.Sim.Instance()
 simulator.set_config(options.config, options.section)
 
-# list simulation runs and exit
+# list simulation runs and exit. runs are enumerated lazily, so very large
+# sweeps can be listed or sliced with --runs
 if options.list or options.verbose_list:
     runs_count = simulator.get_runs_count()
-    for i in range(runs_count):
+    if options.runs != "":
+        runs = parse_runs(options.runs, runs_count)
+    else:
+        runs = xrange(runs_count)
+    for i in runs:
         if options.list:
             print("./main.py -c %s -s %s -r %d" %
                 (options.config, options.section, i))
@@ -62,5 +235,76 @@ if options.list or options.verbose_list:
                 (options.config, options.section, i, simulator.get_params(i)))
     sys.exit(0)
 
-simulator.initialize(options.run)
-simulator.run()
+# write the requests of a run to a trace file and exit
+if options.write_trace != "":
+    config = simulator.config
+    if options.run >= config.get_runs_count():
+        print("Run %d does not exist" % options.run)
+        sys.exit(1)
+    config.set_run_number(options.run)
+    workload.generate(config.get_param(cluster.Cluster.SIZE),
+                      config.get_param(cluster.Cluster.OFFER),
+                      config.get_param(sim.Simulation.PAR_SEED),
+                      options.trace_length, options.write_trace)
+    sys.exit(0)
+
+run_cache = RunCache(options.run_index)
+
+# run a sweep of simulations on a pool of worker processes, skipping the runs
+# completed with the same parameters, even if under a different run number
+if options.all or options.runs != "":
+    runs_count = simulator.get_runs_count()
+    if options.all:
+        runs = xrange(runs_count)
+    else:
+        runs = parse_runs(options.runs, runs_count)
+    # the completed runs are filtered while the sweep is running, so that
+    # very large sweeps are never enumerated up front
+    skipped = [0]
+    pending = get_pending_runs(simulator.config, runs, skipped)
+    first = next(pending, None)
+    completed = 0
+    total_time = 0
+    allocations = 0
+    start_time = time.time()
+    if first is not None:
+        pool = Pool(options.jobs, init_worker)
+        print("%6s %12s %12s %8s %10s" %
+              ("run", "time (s)", "deployments", "failed", "allocs/s"))
+        for result in pool.imap_unordered(run_simulation,
+                                          itertools.chain([first], pending)):
+            run, run_time, deployments, failed, key, output_file = result
+            print("%6d %12.2f %12d %8d %10.1f" %
+                  (run, run_time, deployments, failed,
+                   (deployments + failed) / max(run_time, 1e-9)))
+            sys.stdout.flush()
+            run_cache.add(key, output_file)
+            completed += 1
+            total_time += run_time
+            allocations += deployments + failed
+        pool.close()
+        pool.join()
+    if skipped[0] > 0:
+        print("Skipped %d completed runs. Use --force to simulate them "
+              "again" % skipped[0])
+    print("Completed %d runs in %.2f s (%.2f s of simulation, %.1f allocs/s "
+          "per run)" % (completed, time.time() - start_time, total_time,
+                        allocations / max(total_time, 1e-9)))
+    sys.exit(0)
+
+if options.run < simulator.get_runs_count():
+    key, output_file = get_completed_output(simulator.config, options.run)
+    if output_file is not None:
+        print("Run %d already completed: %s. Use --force to simulate it "
+              "again" % (options.run, output_file))
+        sys.exit(0)
+simulator.initialize(options.run, resume=options.resume)
+reporters = get_reporters(simulator)
+if options.headless:
+    simulator.run(False, reporters)
+    simulator.print_summary()
+else:
+    simulator.run(True, reporters)
+dump_instrumentation(simulator, reporters)
+run_cache.add(simulator.config.get_run_key(),
+              simulator.config.get_output_file())
@@ -0,0 +1,74 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import json
+import sys
+import time
+
+
+class StatusReporter:
+    """
+    Reports the progress of a simulation without a terminal, as JSON lines
+    written every interval seconds to stderr or to a status file. Lines carry
+    the run number, so several runs can share the same file
+    """
+
+    def __init__(self, status_file=None, interval=10):
+        """
+        Constructor
+        :param status_file: file the status lines are appended to, opened only
+        while writing a line. By default they are written to stderr
+        :param interval: seconds between two status lines
+        """
+        self.interval = interval
+        self.status_file = status_file
+        self.start_time = time.time()
+
+    def start(self):
+        """
+        Marks the beginning of a run
+        """
+        self.start_time = time.time()
+
+    def report(self, sim, done=False):
+        """
+        Writes a status line
+        :param sim: the running simulation
+        :param done: whether the run is completed
+        """
+        elapsed = time.time() - self.start_time
+        allocations = sim.deployments + sim.failed
+        rate = allocations / elapsed if elapsed > 0 else 0.0
+        # estimate the remaining time from the rate of successful deployments
+        eta = None
+        if not done and sim.deployments > 0:
+            remaining = max(0, sim.expected_deployments - sim.deployments)
+            eta = remaining * elapsed / sim.deployments
+        status = {"run": sim.run_number,
+                  "state": "done" if done else "running",
+                  "elapsed": round(elapsed, 3),
+                  "deployments": sim.deployments,
+                  "failed": sim.failed,
+                  "expected": sim.expected_deployments,
+                  "allocation_prob": sim.allocation_prob,
+                  "rate": round(rate, 1),
+                  "eta": None if eta is None else round(eta, 1)}
+        line = json.dumps(status, sort_keys=True) + "\n"
+        if self.status_file is None:
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(self.status_file, "a") as f:
+                f.write(line)
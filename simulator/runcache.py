@@ -0,0 +1,94 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import json
+import os
+import time
+
+
+class RunCache:
+    """
+    Index of the completed runs, mapping the key of a run, as returned by
+    Config.get_run_key(), to its output file. The index is a file of JSON
+    lines, one per completed run, where later lines replace earlier ones with
+    the same key. It is compacted when loaded if it has replaced or
+    incomplete lines
+    """
+
+    def __init__(self, index_file):
+        """
+        Constructor
+        :param index_file: the index file. created when the first run is added
+        """
+        self.index_file = index_file
+        # key -> {"output": output file, "time": completion time}
+        self.runs = {}
+        if os.path.exists(index_file):
+            self.load()
+
+    def load(self):
+        """
+        Reads the index file, compacting it if needed
+        """
+        lines = 0
+        with open(self.index_file) as f:
+            for line in f:
+                lines += 1
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    # a line left incomplete by an interrupted run
+                    continue
+                self.runs[run.pop("key")] = run
+        if lines > len(self.runs):
+            # write and rename, so an interrupted write never loses the index
+            with open(self.index_file + ".tmp", "w") as f:
+                for key in sorted(self.runs):
+                    f.write(self.format(key, self.runs[key]))
+            os.rename(self.index_file + ".tmp", self.index_file)
+
+    @staticmethod
+    def format(key, run):
+        """
+        Returns the line of the index file of a run
+        :param key: the key of the run
+        :param run: the run, as stored in self.runs
+        """
+        line = dict(run)
+        line["key"] = key
+        return json.dumps(line, sort_keys=True) + "\n"
+
+    def get(self, key):
+        """
+        Returns the output file of a completed run
+        :param key: the key of the run
+        :returns: the output file or None if the run has not been completed or
+        its output file does not exist anymore
+        """
+        run = self.runs.get(key)
+        if run is None or not os.path.exists(run["output"]):
+            return None
+        return run["output"]
+
+    def add(self, key, output_file):
+        """
+        Records a completed run, appending it to the index file
+        :param key: the key of the run
+        :param output_file: the output file of the run
+        """
+        run = {"output": output_file, "time": time.time()}
+        self.runs[key] = run
+        with open(self.index_file, "a") as f:
+            f.write(RunCache.format(key, run))
@@ -14,25 +14,26 @@
 # Copyright (C) 2016 Michele Segata <segata@ccs-labs.org>
 # Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
 
+import os
 import sys
-import random
-import scipy
+import cPickle as pickle
 import time
 import math
 import curses
 from singleton import Singleton
 from config import Config
 from cluster import Cluster
-from log import Log
+from workload import TraceEnded
+from log import Log, MemoryLog, ParquetLog, RecordLog
 
 # VT100 command for erasing content of the current prompt line
 ERASE_LINE = '\x1b[2K'
 
 
-@Singleton
-class Sim:
+class Simulation:
     """
-    Main simulator class
+    Main simulator class. Use Sim.Instance() from the command line tool and
+    simulate() to run simulations in memory from other programs
     """
 
     # name of the section in the configuration file that includes all simulation
@@ -47,6 +48,17 @@ class Sim:
     # higher than this value
     HALTING_THRESHOLD = "halting_threshold"
 
+    # seconds between two checkpoints of the simulation state. 0 disables
+    # checkpoints
+    CHECKPOINT_INTERVAL = "checkpoint_interval"
+
+    # minimum seconds between two checkpoints, whatever the configured
+    # interval, so that saving large states never dominates the run
+    MIN_CHECKPOINT_INTERVAL = 1
+
+    # extension appended to the output file name to get the checkpoint file
+    CHECKPOINT_EXTENSION = ".checkpoint"
+
     def __init__(self):
         """
         Constructor initializing current cluster allocation to 0
@@ -57,6 +69,8 @@ class Sim:
         self.config_file = ""
         # empty section
         self.section = ""
+        # no configuration loaded yet
+        self.config = None
 
     def set_config(self, config_file, section):
         """
@@ -69,23 +83,37 @@ class Sim:
         # instantiate config manager
         self.config = Config(self.config_file, self.section)
 
+    def set_params(self, params, section="simulation"):
+        """
+        Set simulation parameters without reading them from a config file
+        :param params: the parameters, as they would appear in a section of the
+        config file
+        :param section: the section name
+        """
+        self.section = section
+        self.config = Config(None, section, {section: params})
+
     def get_runs_count(self):
         """
         Returns the number of runs for the given config file and section
         :returns: the total number of runs
         """
-        if self.config_file == "" or self.section == "":
+        if self.config is None:
             print("Configuration error. Call set_config() before "
                   "get_runs_count()")
             sys.exit(1)
         return self.config.get_runs_count()
 
-    def initialize(self, run_number):
+    def initialize(self, run_number, logger=None, resume=False):
         """
         Simulation initialization method
         :param run_number: the index of the simulation to be run
+        :param logger: data logger receiving the results. By default results
+        are written to the output file of the run
+        :param resume: whether to continue from the last checkpoint of the
+        run, if any. Only runs writing to their output file are checkpointed
         """
-        if self.config_file == "" or self.section == "":
+        if self.config is None:
             print("Configuration error. Call set_config() before initialize()")
             sys.exit(1)
         # set and check run number
@@ -96,21 +124,70 @@ class Sim:
                   "runs" % run_number)
             sys.exit(1)
         self.config.set_run_number(run_number)
+        self.checkpoint_interval = float(self.config.get_param(
+            self.CHECKPOINT_INTERVAL, 0))
+        if self.checkpoint_interval > 0:
+            self.checkpoint_interval = max(self.checkpoint_interval,
+                                           self.MIN_CHECKPOINT_INTERVAL)
+        self.checkpoint_file = None
+        checkpoint = None
+        # records written to the output after the checkpoint, if resuming
+        logged = 0
         # instantiate data logger
-        self.logger = Log(self.config.get_output_file())
+        if logger is None:
+            output_file = self.config.get_output_file()
+            self.checkpoint_file = output_file + self.CHECKPOINT_EXTENSION
+            if resume:
+                checkpoint = self.load_checkpoint()
+            if output_file.endswith(ParquetLog.EXTENSION):
+                if self.checkpoint_interval > 0:
+                    print("Configuration error. Checkpoints are not supported "
+                          "with %s output files" % ParquetLog.EXTENSION)
+                    sys.exit(1)
+                logger = ParquetLog(output_file, self.config.get_run_params())
+            elif output_file.endswith(RecordLog.EXTENSION):
+                offset = None
+                if checkpoint is not None:
+                    offset = checkpoint["log_offset"]
+                    logged = RecordLog.count_records(output_file, offset)
+                logger = RecordLog(output_file, self.config.get_run_params(),
+                                   offset)
+            elif checkpoint is not None:
+                logged = Log.count_records(output_file,
+                                           checkpoint["log_offset"])
+                logger = Log(output_file, checkpoint["log_offset"])
+            else:
+                logger = Log(output_file)
+        self.logger = logger
 
-        # get seeds. each seed generates a simulation repetition
+        # get seeds. each seed generates a simulation repetition. the cluster
+        # derives the seeds of its PRNGs from it, no global PRNG is seeded
         self.seed = self.config.get_param(self.PAR_SEED)
-        random.seed(self.seed)
-        scipy.random.seed(self.seed)
 
         self.halting_threshold = self.config.get_param(self.HALTING_THRESHOLD)
 
-        self.cluster = Cluster()
+        self.cluster = Cluster(self.logger)
 
         # initialize cluster
         self.cluster.initialize(self.config)
 
+        self.deployments = 0
+        self.failed = 0
+        # simulation time spent before the last checkpoint, when resuming
+        self.elapsed = 0
+        # deployments left on the cluster after the checkpoint, when resuming
+        self.recovered = 0
+        if checkpoint is not None:
+            self.deployments = checkpoint["deployments"]
+            self.failed = checkpoint["failed"]
+            self.elapsed = checkpoint["elapsed"]
+            self.cluster.set_state(checkpoint["cluster"])
+            # deployments created after the checkpoint are still on the
+            # cluster, delete them before their names are used again
+            if self.cluster.remote:
+                self.recovered = self.cluster.recover(
+                    logged + self.cluster.window + Cluster.RECOVERY_MARGIN)
+
         # all done. simulation can start now
         self.initialized = True
 
@@ -120,9 +197,15 @@ class Sim:
         """
         return self.logger
 
-    def run(self):
+    def run(self, interactive=True, reporters=()):
         """
         Runs the simulation.
+        :param interactive: whether to show the progress on the terminal and
+        print a summary at the end. Non interactive runs only store the results
+        in the deployments, failed and total_time fields
+        :param reporters: objects notified of the progress every interval
+        seconds through their report() method, like StatusReporter for
+        headless runs
         """
         # first check that everything is ready
         if not self.initialized:
@@ -133,47 +216,161 @@ class Sim:
         # last time we printed the simulation percentage
         prev_time = start_time
         self.expected_deployments = self.cluster.get_expected_deployments()
-        self.deployments = 0
-        self.failed = 0
         self.allocation_prob = self.cluster.get_allocation_probability()
+        self.trace_ended = False
+        # last time each reporter was notified
+        report_times = [start_time] * len(reporters)
+        checkpoints = self.checkpoint_file is not None and \
+            self.checkpoint_interval > 0
+        # last time the state was checkpointed
+        checkpoint_time = start_time
+        for reporter in reporters:
+            reporter.start()
+            reporter.report(self)
 
         try:
-            self.stdscr = curses.initscr()
-
-            # print percentage for the first time (0%)
-            self.print_percentage(True)
+            if interactive:
+                self.stdscr = curses.initscr()
+                # print percentage for the first time (0%)
+                self.print_percentage(True)
+            convergence = self.cluster.convergence
             # main simulation loop
             while self.allocation_prob > self.halting_threshold:
-                # request next allocation
-                if(self.cluster.request_allocation()):
+                # request next allocation, until the trace (if any) ends
+                try:
+                    accepted = self.cluster.request_allocation()
+                except TraceEnded:
+                    self.trace_ended = True
+                    break
+                if accepted:
                     self.deployments += 1
                 else:
                     self.failed += 1
 
-                # get current real time
-                curr_time = time.time()
-                # if more than a second has elapsed, update the percentage bar
-                if curr_time - prev_time >= 1:
-                    self.print_percentage(False)
-                    prev_time = curr_time
+                if interactive or reporters or checkpoints:
+                    # get current real time
+                    curr_time = time.time()
+                    # if more than a second has elapsed, update the percentage
+                    # bar
+                    if interactive and curr_time - prev_time >= 1:
+                        self.print_percentage(False)
+                        prev_time = curr_time
+                    for i, reporter in enumerate(reporters):
+                        if curr_time - report_times[i] >= reporter.interval:
+                            reporter.report(self)
+                            report_times[i] = curr_time
+                    if checkpoints and \
+                            curr_time - checkpoint_time >= \
+                            self.checkpoint_interval:
+                        self.save_checkpoint(curr_time - start_time)
+                        # time the next checkpoint from the end of this one,
+                        # which can take longer than the interval
+                        checkpoint_time = time.time()
 
                 # Update allocation probability
                 self.allocation_prob = self.cluster.get_allocation_probability()
 
-            #Clean up
-            self.cluster.finalize()
+                # stop early if the results already converged
+                if convergence is not None and convergence.converged:
+                    break
+
+            # commit the requests that were still in flight when halting
+            for result in self.cluster.drain():
+                if result:
+                    self.deployments += 1
+                else:
+                    self.failed += 1
 
-            # simulation completed, print the percentage for the last time (100%)
-            self.print_percentage(False)
+            #Clean up
+            self.logger.close()
+            if interactive:
+                self.cluster.finalize(self.print_teardown)
+                # simulation completed, print the percentage for the last time
+                # (100%)
+                self.print_percentage(False)
+            else:
+                self.cluster.finalize()
+            # the run is complete, there is nothing left to resume
+            if self.checkpoint_file is not None and \
+                    os.path.exists(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
         finally:
-            curses.endwin()
+            if interactive:
+                curses.endwin()
 
         # compute how much time the simulation took
         end_time = time.time()
-        total_time = round(end_time - start_time)
+        self.total_time = self.elapsed + end_time - start_time
+        for reporter in reporters:
+            reporter.report(self, True)
+        if interactive:
+            self.print_summary()
+
+    def save_checkpoint(self, elapsed):
+        """
+        Commits the requests in flight and writes the state of the simulation
+        to the checkpoint file, replacing the previous checkpoint
+        :param elapsed: seconds elapsed since the simulation (re)started
+        """
+        for result in self.cluster.drain():
+            if result:
+                self.deployments += 1
+            else:
+                self.failed += 1
+        checkpoint = {"params": self.config.get_run_params(),
+                      "deployments": self.deployments,
+                      "failed": self.failed,
+                      "elapsed": self.elapsed + elapsed,
+                      "log_offset": self.logger.get_offset(),
+                      "cluster": self.cluster.get_state()}
+        # write to a temporary file first, so that a kill while writing
+        # leaves the previous checkpoint intact
+        temp_file = self.checkpoint_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_file, self.checkpoint_file)
+
+    def load_checkpoint(self):
+        """
+        Reads the last checkpoint of the current run
+        :returns: the checkpoint or None if the run has no checkpoint
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file, "rb") as f:
+            checkpoint = pickle.load(f)
+        if checkpoint["params"] != self.config.get_run_params():
+            print("Simulation error. The checkpoint %s was written with "
+                  "different parameters" % self.checkpoint_file)
+            sys.exit(1)
+        return checkpoint
+
+    def print_summary(self):
+        """
+        Prints the results of the last run
+        """
+        total_time = round(self.total_time)
+        if self.cluster.convergence is not None and \
+                self.cluster.convergence.converged:
+            print("Results converged (%s criterion). Terminating." %
+                  self.cluster.convergence.criterion)
+        if self.trace_ended:
+            print("Reached the end of the trace %s. Terminating." %
+                  self.cluster.trace.trace_file)
         print("Reached allocation probability of %.2f. Terminating." % self.allocation_prob)
+        if self.recovered > 0:
+            print("Deleted %d deployments created after the checkpoint" %
+                  self.recovered)
         print("Failed deployments: %d" % self.failed)
         print("Successful deployments: %d" % self.deployments)
+        if self.cluster.teardown_mode == Cluster.TEARDOWN_BACKGROUND:
+            print("Deleting deployments in the background")
+        else:
+            print("Deleted deployments: %d (%d failed)" %
+                  (self.cluster.deleted, len(self.cluster.teardown_failures)))
+        if self.cluster.reconciliations > 0:
+            print("Capacity reconciliations: %d (max drift %.2f)" %
+                  (self.cluster.reconciliations, self.cluster.max_drift))
         print("Total simulation time: %d hours, %d minutes, %d seconds" %
               (total_time / 3600, total_time % 3600 / 60,
                total_time % 3600 % 60))
@@ -188,6 +385,11 @@ class Sim:
 
         self.stdscr.refresh()
 
+    def print_teardown(self, deleted, failed, total):
+        self.stdscr.addstr(5, 0, "Deleting deployments: %d/%d (%d failed)" %
+                           (deleted + failed, total, failed))
+        self.stdscr.refresh()
+
     def get_params(self, run_number):
         """
         Returns a textual representation of simulation parameters for a given
@@ -196,3 +398,35 @@ class Sim:
         :returns: textual representation of parameters for run_number
         """
         return self.config.get_params(run_number)
+
+
+@Singleton
+class Sim(Simulation):
+    """
+    Simulator instance of the command line tool
+    """
+    pass
+
+
+def simulate(params, run_number=0, dataframe=False):
+    """
+    Runs a simulation without touching the disk or the terminal
+    :param params: simulation parameters, as they would appear in a section of
+    the config file. The output parameter is ignored
+    :param run_number: the run to simulate when some parameters are lists of
+    values
+    :param dataframe: whether to return a pandas DataFrame instead of numpy
+    arrays
+    :returns: a map from column name to numpy array with the allocation
+    records, or a DataFrame with the same columns
+    """
+    simulation = Simulation()
+    simulation.set_params(params)
+    logger = MemoryLog()
+    simulation.initialize(run_number, logger)
+    simulation.run(False)
+    records = logger.get_records()
+    if dataframe:
+        import pandas as pd
+        return pd.DataFrame(records, columns=Log.COLUMNS)
+    return records
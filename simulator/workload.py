@@ -0,0 +1,102 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2018 Daniel Zozin <d.zozin@fbk.eu>
+
+import sys
+import numpy as np
+from distribution import Distribution, derive_seed
+
+
+class TraceEnded(Exception):
+    """
+    Raised when all the requests of a trace have been used
+    """
+    pass
+
+
+class Trace:
+    """
+    Recorded stream of deployment requests, stored as a numpy array of
+    (size, offer) records in a .npy file. The size is scaled and the offer is
+    per unit of resource, like the values drawn from the size and offer
+    distributions. The file is memory mapped, so runs sharing a trace share
+    the same pages instead of holding a copy each
+    """
+
+    # type of the records of a trace
+    DTYPE = np.dtype([("size", "<f8"), ("offer", "<f8")])
+    # number of records copied at once from the mapped file
+    CHUNK_SIZE = 4096
+
+    def __init__(self, trace_file):
+        """
+        Constructor
+        :param trace_file: the trace file, as written by generate()
+        """
+        self.trace_file = trace_file
+        try:
+            self.records = np.load(trace_file, mmap_mode="r")
+        except IOError as e:
+            print("Trace error: cannot read %s: %s" % (trace_file, e))
+            sys.exit(1)
+        if self.records.dtype != Trace.DTYPE or self.records.ndim != 1:
+            print("Trace error: %s is not a trace of (size, offer) records" %
+                  trace_file)
+            sys.exit(1)
+        # records of the current chunk and index of the first one
+        self.sizes = []
+        self.offers = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_request(self, index):
+        """
+        Returns a request of the trace
+        :param index: the index of the request
+        :returns: a tuple (size, offer)
+        :raises TraceEnded: if the trace has less than index + 1 requests
+        """
+        i = index - self.start
+        if i < 0 or i >= len(self.sizes):
+            if index >= len(self.records):
+                raise TraceEnded("%s ended after %d requests" %
+                                 (self.trace_file, len(self.records)))
+            chunk = self.records[index:index + Trace.CHUNK_SIZE]
+            self.sizes = chunk["size"].tolist()
+            self.offers = chunk["offer"].tolist()
+            self.start = index
+            i = 0
+        return self.sizes[i], self.offers[i]
+
+
+def generate(size, offer, seed, length, trace_file):
+    """
+    Writes a trace drawing the requests from the size and offer distributions,
+    with the same streams used by a run with the same seed
+    :param size: configuration of the size distribution
+    :param offer: configuration of the offer distribution
+    :param seed: the seed of the run
+    :param length: number of requests
+    :param trace_file: the output file
+    """
+    # same streams as the distributions of the cluster
+    records = np.empty(length, dtype=Trace.DTYPE)
+    records["size"] = Distribution(size, derive_seed(seed, "size")) \
+        .get_values(length)
+    records["offer"] = Distribution(offer, derive_seed(seed, "offer")) \
+        .get_values(length)
+    with open(trace_file, "wb") as f:
+        np.save(f, records)
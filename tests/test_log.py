@@ -0,0 +1,85 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'simulator'))
+
+from log import RecordLog
+from local_backend import Allocation, DeploymentRequest
+
+PARAMS = {'seed': 0, 'backend': 'local', 'nodes': 10}
+
+
+class RecordLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp, 'log' + RecordLog.EXTENSION)
+        self.allocation = Allocation('node-0', 0.5, 10240.0, 5120.0, 5.0,
+                                     {'memory': {'used': 1024.0}})
+        self.request = DeploymentRequest('test', 10240.0,
+                                         [{'name': 'memory',
+                                           'amount': 1024.0}])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_readable_when_opened(self):
+        logger = RecordLog(self.output, PARAMS)
+        self.assertEqual(len(RecordLog.read(self.output)), 0)
+        self.assertEqual(RecordLog.read_header(self.output)['params'], PARAMS)
+        logger.close()
+
+    def test_visible_after_flush(self):
+        logger = RecordLog(self.output, PARAMS)
+        logger.log_allocation(self.allocation, 'memory')
+        logger.log_failure(self.request)
+        logger.flush()
+        records = RecordLog.read(self.output)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records['accepted'].tolist(), [1, 0])
+        self.assertEqual(records['node'][0], b'node-0')
+        logger.close()
+
+    def test_visible_after_flush_interval(self):
+        logger = RecordLog(self.output, PARAMS)
+        # as if the last append happened more than FLUSH_INTERVAL ago
+        logger.flush_time -= RecordLog.FLUSH_INTERVAL
+        logger.log_allocation(self.allocation, 'memory')
+        self.assertEqual(len(RecordLog.read(self.output)), 1)
+        logger.close()
+
+    def test_visible_when_batch_full(self):
+        logger = RecordLog(self.output, PARAMS)
+        for i in range(RecordLog.BATCH_SIZE):
+            logger.log_failure(self.request)
+        self.assertEqual(len(RecordLog.read(self.output)),
+                         RecordLog.BATCH_SIZE)
+        logger.close()
+
+    def test_partial_record_ignored(self):
+        logger = RecordLog(self.output, PARAMS)
+        logger.log_allocation(self.allocation, 'memory')
+        logger.close()
+        with open(self.output, 'ab') as f:
+            f.write(b'\0' * (RecordLog.DTYPE.itemsize // 2))
+        self.assertEqual(len(RecordLog.read(self.output)), 1)
+
+    def test_resume_from_offset(self):
+        logger = RecordLog(self.output, PARAMS)
+        logger.log_allocation(self.allocation, 'memory')
+        offset = logger.get_offset()
+        logger.log_failure(self.request)
+        logger.close()
+        logger = RecordLog(self.output, PARAMS, offset)
+        logger.log_failure(self.request)
+        logger.close()
+        records = RecordLog.read(self.output)
+        self.assertEqual(records['accepted'].tolist(), [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()